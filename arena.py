@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+# arena.py - Array-backed AST arena for Mini Triangle
+
+from array import array
+
+import ast
+
+
+# Node kinds, one per ast class, with each class's constructor arguments
+# in order. An argument is stored according to its name: scalar fields in
+# the vals column, the symbol id beside its value, node lists in the lists
+# column, and child nodes in the a, b and c columns in order.
+
+LAYOUT = [('Program',               ('command',)),
+          ('AssignCommand',         ('variable', 'expression')),
+          ('CallCommand',           ('identifier', 'expression')),
+          ('SequentialCommand',     ('command1', 'command2')),
+          ('BlockCommand',          ('commands',)),
+          ('IfCommand',             ('expression', 'command1', 'command2')),
+          ('WhileCommand',          ('expression', 'command')),
+          ('LetCommand',            ('declaration', 'command')),
+          ('ErrorCommand',          ('error',)),
+          ('IntegerExpression',     ('value',)),
+          ('VnameExpression',       ('variable',)),
+          ('UnaryExpression',       ('operator', 'expression')),
+          ('BinaryExpression',      ('expr1', 'oper', 'expr2')),
+          ('ErrorExpression',       ('error',)),
+          ('Vname',                 ('identifier', 'sym')),
+          ('ConstDeclaration',      ('identifier', 'expression', 'sym')),
+          ('VarDeclaration',        ('identifier', 'type_denoter', 'sym')),
+          ('SequentialDeclaration', ('decl1', 'decl2')),
+          ('DeclarationList',       ('declarations',)),
+          ('ErrorDeclaration',      ('error',)),
+          ('TypeDenoter',           ('identifier',))]
+
+(K_PROGRAM, K_ASSIGN, K_CALL, K_SEQ_COMMAND, K_BLOCK, K_IF, K_WHILE, K_LET,
+ K_ERROR_COMMAND, K_INTEGER, K_VNAME_EXPR, K_UNARY, K_BINARY,
+ K_ERROR_EXPR, K_VNAME, K_CONST, K_VAR, K_SEQ_DECL, K_DECL_LIST,
+ K_ERROR_DECL, K_TYPE_DENOTER) = range(len(LAYOUT))
+
+VALUE_FIELDS = frozenset(['identifier', 'value', 'operator', 'oper', 'error'])
+LIST_FIELDS = frozenset(['commands', 'declarations'])
+
+# Per kind: the child fields, the value field and the list field, if any.
+CHILD_FIELDS = []
+VALUE_FIELD = []
+LIST_FIELD = []
+for name, args in LAYOUT:
+    CHILD_FIELDS.append(tuple(f for f in args
+                              if f not in VALUE_FIELDS and f not in LIST_FIELDS
+                              and f != 'sym'))
+    VALUE_FIELD.append(([f for f in args if f in VALUE_FIELDS] + [None])[0])
+    LIST_FIELD.append(([f for f in args if f in LIST_FIELDS] + [None])[0])
+del name, args
+
+KIND = dict((getattr(ast, name), kind) for kind, (name, args) in enumerate(LAYOUT))
+
+# Kinds whose nodes have no span and are never modified; equal ones are
+# stored once.
+SHARED_KINDS = frozenset([K_INTEGER, K_VNAME_EXPR, K_VNAME, K_TYPE_DENOTER])
+
+NONE = -1
+
+
+class Arena(object):
+    """ A compact, column-wise store of AST nodes, addressed by index.
+
+        kinds:   array of node kinds, the K_* constants
+        a, b, c: arrays of child node indexes, in the order of LAYOUT;
+                 for a BlockCommand or DeclarationList, a is the offset
+                 of its children in lists and b their number
+        vals:    array of indexes into values
+        starts:  array of span starts
+        ends:    array of span ends
+        lists:   array of the child indexes of list nodes
+        values:  table of distinct scalar field values, each stored once
+        syms:    symbol id of each value, else None
+        root:    index of the root node
+
+        Missing children, values and spans are stored as NONE. Children
+        are always added before their parents.
+    """
+
+    def __init__(self):
+        self.kinds = array('i')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.vals = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+        self.lists = array('i')
+        self.values = []
+        self.syms = []
+        self.value_index = {}
+        self.shared = {}
+        self.root = NONE
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def value(self, val, sym=None):
+        """Return the index of (val, sym) in values, adding it if new."""
+
+        key = (val, sym)
+        index = self.value_index.get(key)
+        if index is None:
+            index = self.value_index[key] = len(self.values)
+            self.values.append(val)
+            self.syms.append(sym)
+        return index
+
+    def append(self, kind, a=NONE, b=NONE, c=NONE, val=NONE,
+               start=None, end=None):
+        """Add a node and return its index. val is an index into values."""
+
+        if kind in SHARED_KINDS:
+            key = (kind, a, val)
+            index = self.shared.get(key)
+            if index is not None:
+                return index
+            self.shared[key] = len(self.kinds)
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        self.vals.append(val)
+        self.starts.append(NONE if start is None else start)
+        self.ends.append(NONE if end is None else end)
+        return len(self.kinds) - 1
+
+    def children(self, index):
+        """Return the indexes of the child nodes of a node, in order."""
+
+        kind = self.kinds[index]
+        if LIST_FIELD[kind] is not None:
+            offset = self.a[index]
+            return self.lists[offset:offset + self.b[index]].tolist()
+        columns = (self.a, self.b, self.c)[:len(CHILD_FIELDS[kind])]
+        return [column[index] for column in columns]
+
+    def value_of(self, index):
+        """Return the scalar field value of a node, or None."""
+
+        val = self.vals[index]
+        if val == NONE:
+            return None
+        return self.values[val]
+
+    def sym_of(self, index):
+        """Return the symbol id of a node's value, or None."""
+
+        val = self.vals[index]
+        if val == NONE:
+            return None
+        return self.syms[val]
+
+
+def from_ast(tree, arena=None):
+    """ Store an ast tree in an arena and return the arena.
+
+        Nodes are visited with an explicit stack, so tree depth is not
+        limited by recursion. A node reached twice, such as a leaf from
+        an InterningFactory, is stored once.
+    """
+
+    if arena is None:
+        arena = Arena()
+    append = arena.append
+    lists = arena.lists
+    index_of = {}
+    stack = [tree]
+    while stack:
+        node = stack[-1]
+        if id(node) in index_of:
+            stack.pop()
+            continue
+        kind = KIND[type(node)]
+        fields = CHILD_FIELDS[kind]
+        list_field = LIST_FIELD[kind]
+        if list_field is not None:
+            children = getattr(node, list_field)
+        else:
+            children = [getattr(node, f) for f in fields]
+        pending = [child for child in children if id(child) not in index_of]
+        if pending:
+            stack.extend(reversed(pending))
+            continue
+        stack.pop()
+
+        indexes = [index_of[id(child)] for child in children]
+        if list_field is not None:
+            indexes = [len(lists), len(indexes)] + [NONE]
+            lists.extend([index_of[id(child)] for child in children])
+        else:
+            indexes.extend([NONE] * (3 - len(indexes)))
+        field = VALUE_FIELD[kind]
+        if field is None:
+            val = NONE
+        else:
+            val = arena.value(getattr(node, field), getattr(node, 'sym', None))
+        index_of[id(node)] = append(kind, indexes[0], indexes[1], indexes[2],
+                                    val, getattr(node, 'start', None),
+                                    getattr(node, 'end', None))
+    arena.root = index_of[id(tree)]
+    return arena
+
+
+def to_ast(arena, factory=ast):
+    """ Build the ast tree of an arena with a node factory.
+
+        Since children precede their parents, nodes are built in index
+        order in one pass. A node shared in the arena is shared in the
+        tree.
+    """
+
+    nodes = []
+    append = nodes.append
+    kinds, a, b, c = arena.kinds, arena.a, arena.b, arena.c
+    vals, starts, ends, lists = arena.vals, arena.starts, arena.ends, arena.lists
+    values, syms = arena.values, arena.syms
+    classes = [getattr(factory, name) for name, args in LAYOUT]
+    columns = (a, b, c)
+
+    for index in xrange(len(kinds)):
+        kind = kinds[index]
+        name, arg_names = LAYOUT[kind]
+        val = vals[index]
+        args = []
+        child = 0
+        for arg in arg_names:
+            if arg == 'sym':
+                args.append(syms[val])
+            elif arg in VALUE_FIELDS:
+                args.append(values[val])
+            elif arg in LIST_FIELDS:
+                offset = a[index]
+                args.append([nodes[i] for i in lists[offset:offset + b[index]]])
+            else:
+                args.append(nodes[columns[child][index]])
+                child += 1
+        node = classes[kind](*args)
+        start = starts[index]
+        if start != NONE:
+            node.start = start
+            node.end = ends[index]
+        append(node)
+
+    return nodes[arena.root]
+
+
+if __name__ == '__main__':
+    import sys
+    import scanner
+    import parser
+
+    for path in sys.argv[1:]:
+        tree = parser.Parser(scanner.Scanner(scanner.map_file(path))).parse()
+        arena = from_ast(tree)
+        print '%s: %d nodes, %d values' % (path, len(arena), len(arena.values))
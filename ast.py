@@ -1,14 +1,45 @@
 # ast.py - Abstract Syntax Tree for Mini Triangle
 
+from cStringIO import StringIO
+from types import GeneratorType
+import sys
+
 
 class AST(object):
-    
+
+    # Nodes keep their fields in slots rather than a per-instance __dict__;
+    # each class lists the fields it adds. _hash memoizes the structural
+    # hash and is unset until first needed.
+    __slots__ = ('_hash',)
+
     def __init__(self):
         pass
 
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            return structural_hash(self)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, AST):
+            return NotImplemented
+        return structural_equal(self, other)
+
+    def __ne__(self, other):
+        if self is other:
+            return False
+        if not isinstance(other, AST):
+            return NotImplemented
+        return not structural_equal(self, other)
+
 
 class Program(AST):
 
+    __slots__ = ('command',)
+
     def __init__(self, command):
         self.command = command
 
@@ -17,14 +48,20 @@ class Program(AST):
 
 
 class Command(AST):
-    pass
+
+    # Source span set by the parser: the position of the first token and
+    # of the token that follows the command. Both are None until set.
+    __slots__ = ('start', 'end')
 
 
 class AssignCommand(Command):
 
+    __slots__ = ('variable', 'expression')
+
     def __init__(self, variable, expression):
         self.variable = variable
         self.expression = expression
+        self.start = self.end = None
 
     def __str__(self):
         return 'AssignCommand(%s,%s)' % (str(self.variable), str(self.expression))
@@ -32,9 +69,12 @@ class AssignCommand(Command):
 
 class CallCommand(Command):
 
+    __slots__ = ('identifier', 'expression')
+
     def __init__(self, identifier, expression):
         self.identifier = identifier
         self.expression = expression
+        self.start = self.end = None
 
     def __str__(self):
         return 'CallCommand(%s,%s)' % (str(self.identifier), str(self.expression))
@@ -42,20 +82,38 @@ class CallCommand(Command):
 
 class SequentialCommand(Command):
 
+    __slots__ = ('command1', 'command2')
+
     def __init__(self, command1, command2):
         self.command1 = command1
         self.command2 = command2
+        self.start = self.end = None
 
     def __str__(self):
         return 'SequentialCommand(%s,%s)' % (str(self.command1), str(self.command2))
 
 
+class BlockCommand(Command):
+
+    __slots__ = ('commands',)
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.start = self.end = None
+
+    def __str__(self):
+        return 'BlockCommand(%s)' % (','.join([str(c) for c in self.commands]))
+
+
 class IfCommand(Command):
 
+    __slots__ = ('expression', 'command1', 'command2')
+
     def __init__(self, expression, command1, command2):
         self.expression = expression
         self.command1 = command1
         self.command2 = command2
+        self.start = self.end = None
 
     def __str__(self):
         return 'IfCommand(%s,%s,%s)' % (str(self.expression), str(self.command1), str(self.command2))
@@ -63,9 +121,12 @@ class IfCommand(Command):
 
 class WhileCommand(Command):
 
+    __slots__ = ('expression', 'command')
+
     def __init__(self, expression, command):
         self.expression = expression
         self.command = command
+        self.start = self.end = None
 
     def __str__(self):
         return 'WhileCommand(%s,%s)' % (str(self.expression), str(self.command))
@@ -73,20 +134,37 @@ class WhileCommand(Command):
 
 class LetCommand(Command):
 
+    __slots__ = ('declaration', 'command')
+
     def __init__(self, declaration, command):
         self.declaration = declaration
         self.command = command
+        self.start = self.end = None
 
     def __str__(self):
         return 'LetCommand(%s,%s)' % (str(self.declaration), str(self.command))
 
 
+class ErrorCommand(Command):
+
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+        self.start = self.end = None
+
+    def __str__(self):
+        return 'ErrorCommand(%s)' % (str(self.error))
+
+
 class Expression(AST):
-    pass
+    __slots__ = ()
 
 
 class IntegerExpression(Expression):
 
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -96,6 +174,8 @@ class IntegerExpression(Expression):
 
 class VnameExpression(Expression):
 
+    __slots__ = ('variable',)
+
     def __init__(self, variable):
         self.variable = variable
 
@@ -105,6 +185,8 @@ class VnameExpression(Expression):
 
 class UnaryExpression(Expression):
 
+    __slots__ = ('operator', 'expression')
+
     def __init__(self, operator, expression):
         self.operator = operator
         self.expression = expression
@@ -115,6 +197,8 @@ class UnaryExpression(Expression):
 
 class BinaryExpression(Expression):
 
+    __slots__ = ('expr1', 'oper', 'expr2')
+
     def __init__(self, expr1, oper, expr2):
         self.expr1 = expr1
         self.oper  = oper
@@ -124,24 +208,44 @@ class BinaryExpression(Expression):
         return 'BinaryExpression(%s,%s,%s)' % (str(self.expr1), self.oper, str(self.expr2))
 
 
+class ErrorExpression(Expression):
+
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+    def __str__(self):
+        return 'ErrorExpression(%s)' % (str(self.error))
+
+
 class Vname(AST):
 
-    def __init__(self, identifier):
+    __slots__ = ('identifier', 'sym')
+
+    def __init__(self, identifier, sym=None):
         self.identifier = identifier
+        self.sym = sym
 
     def __str__(self):
         return 'Vname(%s)' % (str(self.identifier))
 
 
 class Declaration(AST):
-    pass
+
+    # Source span set by the parser, as for Command.
+    __slots__ = ('start', 'end')
 
 
 class ConstDeclaration(Declaration):
 
-    def __init__(self, identifier, expression):
+    __slots__ = ('identifier', 'expression', 'sym')
+
+    def __init__(self, identifier, expression, sym=None):
         self.identifier = identifier
         self.expression = expression
+        self.sym = sym
+        self.start = self.end = None
 
     def __str__(self):
         return 'ConstDeclaration(%s,%s)' % (str(self.identifier), str(self.expression))
@@ -149,9 +253,13 @@ class ConstDeclaration(Declaration):
 
 class VarDeclaration(Declaration):
 
-    def __init__(self, identifier, type_denoter):
+    __slots__ = ('identifier', 'type_denoter', 'sym')
+
+    def __init__(self, identifier, type_denoter, sym=None):
         self.identifier = identifier
         self.type_denoter = type_denoter
+        self.sym = sym
+        self.start = self.end = None
 
     def __str__(self):
         return 'VarDeclaration(%s,%s)' % (str(self.identifier), str(self.type_denoter))
@@ -159,16 +267,45 @@ class VarDeclaration(Declaration):
 
 class SequentialDeclaration(Declaration):
 
+    __slots__ = ('decl1', 'decl2')
+
     def __init__(self, decl1, decl2):
         self.decl1 = decl1
         self.decl2 = decl2
+        self.start = self.end = None
 
     def __str__(self):
         return 'SequentialDeclaration(%s,%s)' % (str(self.decl1), str(self.decl2))
 
 
+class DeclarationList(Declaration):
+
+    __slots__ = ('declarations',)
+
+    def __init__(self, declarations):
+        self.declarations = declarations
+        self.start = self.end = None
+
+    def __str__(self):
+        return 'DeclarationList(%s)' % (','.join([str(d) for d in self.declarations]))
+
+
+class ErrorDeclaration(Declaration):
+
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+        self.start = self.end = None
+
+    def __str__(self):
+        return 'ErrorDeclaration(%s)' % (str(self.error))
+
+
 class TypeDenoter(AST):
 
+    __slots__ = ('identifier',)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
@@ -176,6 +313,403 @@ class TypeDenoter(AST):
         return 'TypeDonoter(%s)' % (str(self.identifier))
 
 
+def node_classes():
+    """Return the node classes of this module."""
+
+    return [cls for cls in globals().values()
+            if isinstance(cls, type) and issubclass(cls, AST)]
+
+
+# The fields that make up the structure of a node, per node class: the
+# constructor arguments other than the symbol id, which depends on the
+# SymbolTable. Spans are not part of the structure either.
+
+FIELDS = {}
+
+
+def fields_of(cls):
+    fields = FIELDS[cls] = tuple([field for field in cls.__slots__
+                                  if field != 'sym'])
+    return fields
+
+
+def structural_hash(node):
+    """ Return the structural hash of node, computing and memoizing it
+        bottom-up for every node below it that has none yet.
+
+        Two trees with equal structure have equal hashes, whichever
+        SymbolTable they were scanned with and wherever they are in the
+        source.
+    """
+
+    # Collect the unhashed nodes parents first, then hash them in reverse,
+    # so that every child is hashed before its parent.
+    root = node
+    order = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if hasattr(node, '_hash'):
+            continue
+        order.append(node)
+        cls = type(node)
+        for field in FIELDS.get(cls) or fields_of(cls):
+            value = getattr(node, field)
+            if isinstance(value, AST):
+                stack.append(value)
+            elif type(value) is list:
+                stack.extend(value)
+
+    for node in reversed(order):
+        cls = type(node)
+        key = [cls.__name__]
+        for field in FIELDS.get(cls) or fields_of(cls):
+            value = getattr(node, field)
+            if isinstance(value, AST):
+                key.append(value._hash)
+            elif type(value) is list:
+                key.append(tuple([child._hash for child in value]))
+            else:
+                key.append(value)
+        node._hash = hash(tuple(key))
+    return root._hash
+
+
+def structural_equal(node1, node2):
+    """ Return whether two trees have the same structure.
+
+        Pairs of nodes are compared with an explicit stack; the comparison
+        stops at the first pair of different types or hashes, and skips
+        subtrees that are shared.
+    """
+
+    # Hashing the roots hashes every node below them.
+    if hash(node1) != hash(node2):
+        return False
+    stack = [(node1, node2)]
+    while stack:
+        node1, node2 = stack.pop()
+        if node1 is node2:
+            continue
+        cls = type(node1)
+        if type(node2) is not cls or node1._hash != node2._hash:
+            return False
+        for field in FIELDS.get(cls) or fields_of(cls):
+            value1 = getattr(node1, field)
+            value2 = getattr(node2, field)
+            if isinstance(value1, AST):
+                stack.append((value1, value2))
+            elif type(value1) is list:
+                if type(value2) is not list or len(value1) != len(value2):
+                    return False
+                stack.extend(zip(value1, value2))
+            elif value1 != value2:
+                return False
+    return True
+
+
+def clear_hash(node):
+    """Forget the memoized hash of node, after a change to its children.
+    The hashes of its ancestors must be cleared too.
+    """
+
+    try:
+        del node._hash
+    except AttributeError:
+        pass
+
+
+def iter_child_nodes(node):
+    """Generate the child nodes of node, in constructor argument order."""
+
+    for field in type(node).__slots__:
+        value = getattr(node, field)
+        if isinstance(value, AST):
+            yield value
+        elif type(value) is list:
+            for child in value:
+                yield child
+
+
+# Marks the end of a generator visit method.
+
+DONE = object()
+
+
+class NodeVisitor(object):
+    """ Walks a tree, calling a visit_<class name> method for each node.
+
+        A node without a method of its own goes to generic_visit(). The
+        method for every node class is looked up once, when the visitor
+        is created, so dispatch is a single dict lookup.
+
+        A visit method may be a generator that yields child nodes: each
+        yielded node is visited before the generator resumes, and its
+        visit result is sent back as the value of the yield. The walk
+        keeps the suspended generators on an explicit stack, so tree depth
+        is not limited by recursion. A generator's own result is None.
+    """
+
+    def __init__(self):
+        self.dispatch = {}
+        for cls in node_classes():
+            self.dispatch_for(cls)
+
+    def dispatch_for(self, cls):
+        method = getattr(self, 'visit_' + cls.__name__, self.generic_visit)
+        self.dispatch[cls] = method
+        return method
+
+    def visit(self, node):
+        """Visit node and its descendants and return the node's result."""
+
+        dispatch = self.dispatch
+        result = (dispatch.get(type(node)) or self.dispatch_for(type(node)))(node)
+        if type(result) is not GeneratorType:
+            return result
+
+        # gen is the innermost running generator, and stack holds the
+        # generators suspended around it. A None result is passed back
+        # with next(), which ends a generator without raising StopIteration.
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        next_node = next
+        done = DONE
+        generator = GeneratorType
+        gen = result
+        result = None
+        while 1:
+            if result is None:
+                node = next_node(gen, done)
+            else:
+                try:
+                    node = gen.send(result)
+                except StopIteration:
+                    node = done
+            if node is done:
+                if not stack:
+                    return None
+                gen = pop()
+                result = None
+                continue
+            method = dispatch.get(type(node)) or self.dispatch_for(type(node))
+            result = method(node)
+            if type(result) is generator:
+                push(gen)
+                gen = result
+                result = None
+
+    def generic_visit(self, node):
+        """Visit the children of node."""
+
+        for child in iter_child_nodes(node):
+            yield child
+
+
+class NodeTransformer(NodeVisitor):
+    """ Rebuilds a tree bottom-up.
+
+        The children of each node are transformed first and stored back in
+        its fields, then the node's visit method is called, and the node is
+        replaced by the value it returns. generic_visit() keeps the node.
+        Visit methods are not generators here. Nodes are kept on an
+        explicit stack, as for NodeVisitor.
+    """
+
+    def visit(self, node):
+        """Transform node's subtree and return the replacement for node."""
+
+        dispatch = self.dispatch
+        results = []
+        # Entries are (node, None) before its children are pushed, and
+        # (node, count of its children) after.
+        stack = [(node, None)]
+        while stack:
+            node, count = stack.pop()
+            if count is None:
+                children = list(iter_child_nodes(node))
+                stack.append((node, len(children)))
+                stack.extend([(child, None) for child in reversed(children)])
+                continue
+            if count:
+                new = results[-count:]
+                del results[-count:]
+                replace_child_nodes(node, new)
+            method = dispatch.get(type(node)) or self.dispatch_for(type(node))
+            results.append(method(node))
+        return results[0]
+
+    def generic_visit(self, node):
+        return node
+
+
+def replace_child_nodes(node, new):
+    """Store the nodes of new in the child fields of node, in order."""
+
+    clear_hash(node)
+    new = iter(new)
+    for field in type(node).__slots__:
+        value = getattr(node, field)
+        if isinstance(value, AST):
+            setattr(node, field, next(new))
+        elif type(value) is list:
+            value[:] = [next(new) for child in value]
+
+
+def dump(node, out=None, indent=None, maxdepth=None, maxnodes=None):
+    """ Write node and its descendants to the file object out, by default
+        sys.stdout.
+
+        Without indent the output has the form of str(node). With indent,
+        every node that has child nodes writes them one per line, indented
+        by indent spaces per level. Nodes below maxdepth are written as
+        Name(...), and after maxnodes nodes the rest of the tree is written
+        as '...'. The tree is walked iteratively and output is written in
+        chunks as it is produced, so time is linear in the size of the
+        output and the walk keeps one open iterator per level of depth.
+    """
+
+    if out is None:
+        out = sys.stdout
+    pieces = []
+    put = pieces.append
+    # One [values, depth, multiline, first] entry per open node.
+    stack = []
+    count = 0
+    depth = 0
+    while 1:
+        count += 1
+        if maxnodes is not None and count > maxnodes:
+            put('...')
+            while stack:
+                values, level, multiline, first = stack.pop()
+                if multiline:
+                    put('\n' + ' ' * (indent * level))
+                put(')')
+            break
+        cls = type(node)
+        if maxdepth is not None and depth > maxdepth:
+            put(cls.__name__ + '(...)')
+        else:
+            fields = FIELDS.get(cls) or fields_of(cls)
+            values = [getattr(node, field) for field in fields]
+            parent = False
+            for value in values:
+                if isinstance(value, AST):
+                    parent = True
+                elif type(value) is list:
+                    parent = True
+                    values = [item for value in values
+                              for item in (value if type(value) is list
+                                           else [value])]
+                    break
+            if parent:
+                put(cls.__name__ + '(')
+                stack.append([iter(values), depth, indent is not None, True])
+            else:
+                put('%s(%s)' % (cls.__name__, ','.join(map(str, values))))
+
+        # Write the innermost open node's fields up to its next child node.
+        node = None
+        while stack:
+            frame = stack[-1]
+            values, level, multiline, first = frame
+            value = next(values, DONE)
+            if value is DONE:
+                stack.pop()
+                if multiline:
+                    put('\n' + ' ' * (indent * level))
+                put(')')
+                continue
+            if first:
+                frame[3] = False
+                if multiline:
+                    put('\n' + ' ' * (indent * (level + 1)))
+            elif multiline:
+                put(',\n' + ' ' * (indent * (level + 1)))
+            else:
+                put(',')
+            if isinstance(value, AST):
+                node = value
+                depth = level + 1
+                break
+            put(str(value))
+
+        if len(pieces) > 4096:
+            out.write(''.join(pieces))
+            del pieces[:]
+        if node is None:
+            break
+    out.write(''.join(pieces))
+
+
+def dumps(node, indent=None, maxdepth=None, maxnodes=None):
+    """Return the output of dump() as a string."""
+
+    out = StringIO()
+    dump(node, out, indent, maxdepth, maxnodes)
+    return out.getvalue()
+
+
+class LeafCache(dict):
+    """ A dict of the shared leaf nodes of one class, keyed by the value
+        they are built from; missing nodes are built on first lookup.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+
+    def __missing__(self, key):
+        node = self[key] = self.cls(key)
+        return node
+
+
+class InterningFactory(object):
+    """ A node factory that shares equal leaf nodes.
+
+        Used as Parser(tokens, factory=InterningFactory()). Integer
+        literals, variable names and type denoters are built once per
+        distinct value, and the same node is returned every time that
+        value appears in the tree, so leaves must not be modified. Other
+        nodes are built by the classes of this module as usual.
+    """
+
+    def __init__(self):
+        self.vnames = {}
+        self.vname_expressions = {}
+        # Single-argument leaves are looked up without a Python-level call.
+        self.IntegerExpression = LeafCache(IntegerExpression).__getitem__
+        self.TypeDenoter = LeafCache(TypeDenoter).__getitem__
+
+    def __getattr__(self, name):
+        # Only called for names not set on the factory: the node classes.
+        try:
+            cls = globals()[name]
+        except KeyError:
+            raise AttributeError(name)
+        setattr(self, name, cls)
+        return cls
+
+    def VnameExpression(self, variable):
+        # Keyed by the identity of the shared Vname, not its structure,
+        # which ignores the symbol id. The cached node keeps the Vname
+        # alive, so its id cannot be reused.
+        node = self.vname_expressions.get(id(variable))
+        if node is None:
+            node = VnameExpression(variable)
+            self.vname_expressions[id(variable)] = node
+        return node
+
+    def Vname(self, identifier, sym=None):
+        # A factory reused with another SymbolTable may see the same
+        # identifier with a different symbol id; the newer node wins.
+        node = self.vnames.get(identifier)
+        if node is None or node.sym != sym:
+            node = self.vnames[identifier] = Vname(identifier, sym)
+        return node
+
+
 if __name__ == '__main__':
     pass
     
\ No newline at end of file
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# astfile.py - Binary AST files for Mini Triangle
+
+from array import array
+import marshal
+import struct
+import sys
+import zlib
+
+import ast
+import arena
+from symtab import SymbolTable
+
+
+# A stream is a header followed by any number of tree records:
+#
+#   header:  MAGIC, version (uint16)
+#   record:  'T', node count, list length, root, payload size (int32 each),
+#            the array typecode of each column (8 chars),
+#            the zlib-compressed payload:
+#              the arena columns kinds, a, b, c, vals, starts, ends and
+#              lists as little-endian arrays, each of the narrowest signed
+#              integer type that holds its values,
+#              the marshalled tuple (values, syms, symbol names).
+
+MAGIC = 'MTAST'
+VERSION = 1
+
+HEADER = struct.Struct('<5sH')
+RECORD = struct.Struct('<c4i8s')
+
+COLUMNS = ('kinds', 'a', 'b', 'c', 'vals', 'starts', 'ends', 'lists')
+
+ERROR_KINDS = frozenset([arena.K_ERROR_COMMAND, arena.K_ERROR_EXPR,
+                         arena.K_ERROR_DECL])
+
+SWAP = sys.byteorder != 'little'
+
+# Column types, narrowest first.
+
+TYPECODES = 'bhi'
+
+
+class AstFileError(Exception):
+    """ AST file error exception.
+
+        Raised for streams that are not AST files, are of another version,
+        or are truncated, and for trees that cannot be written.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return 'AstFileError: %s' % (self.message)
+
+
+class Writer(object):
+    """ Write trees to a binary file object, one record per tree.
+
+        The header is written when the Writer is created, and each record
+        as soon as write() is called.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        f.write(HEADER.pack(MAGIC, VERSION))
+
+    def write(self, tree, symbols=None):
+        """Write an ast tree or arena.Arena, with the SymbolTable its
+        symbol ids refer to, if any. Trees with Error nodes are refused.
+        """
+
+        if not isinstance(tree, arena.Arena):
+            tree = arena.from_ast(tree)
+        if ERROR_KINDS.intersection(tree.kinds):
+            raise AstFileError('tree has syntax errors')
+        names = symbols.names if symbols is not None else []
+        table = marshal.dumps((tree.values, tree.syms, names), 2)
+
+        columns = [narrow(getattr(tree, name)) for name in COLUMNS]
+        typecodes = ''.join([column.typecode for column in columns])
+
+        chunks = []
+        for column in columns:
+            if SWAP:
+                column = array(column.typecode, column)
+                column.byteswap()
+            chunks.append(column.tostring())
+        chunks.append(table)
+        payload = zlib.compress(''.join(chunks))
+
+        self.f.write(RECORD.pack('T', len(tree), len(tree.lists), tree.root,
+                                 len(payload), typecodes))
+        self.f.write(payload)
+
+
+class Reader(object):
+    """ Read the trees of a binary file object written by a Writer.
+
+        The header is checked when the Reader is created. Records are read
+        one at a time, so a stream can be consumed while it is written.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise AstFileError('not an AST file')
+        magic, version = HEADER.unpack(header)
+        if version != VERSION:
+            raise AstFileError('unsupported version %d' % version)
+
+    def read_arena(self):
+        """Read the next record as (arena.Arena, SymbolTable).
+
+        Raise EOFError at the end of the stream.
+        """
+
+        read = self.f.read
+        record = read(RECORD.size)
+        if not record:
+            raise EOFError
+        if len(record) < RECORD.size or record[0] != 'T':
+            raise AstFileError('bad record')
+        tag, nodes, lists, root, size, typecodes = RECORD.unpack(record)
+
+        payload = read(size)
+        if len(payload) < size:
+            raise AstFileError('truncated record')
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error:
+            raise AstFileError('bad record')
+
+        tree = arena.Arena()
+        offset = 0
+        for name, typecode in zip(COLUMNS, typecodes):
+            if typecode not in TYPECODES:
+                raise AstFileError('bad record')
+            column = array(typecode)
+            count = lists if name == 'lists' else nodes
+            end = offset + count * column.itemsize
+            if end > len(payload):
+                raise AstFileError('bad record')
+            column.fromstring(payload[offset:end])
+            offset = end
+            if SWAP:
+                column.byteswap()
+            if typecode != 'i':
+                column = array('i', column)
+            setattr(tree, name, column)
+        try:
+            tree.values, tree.syms, names = marshal.loads(payload[offset:])
+        except (EOFError, ValueError, TypeError):
+            raise AstFileError('bad record')
+        tree.root = root
+
+        symbols = SymbolTable()
+        for name in names:
+            symbols.intern(name)
+        return tree, symbols
+
+    def read(self, factory=ast):
+        """Read the next record as (tree, SymbolTable), building the tree
+        with factory. Raise EOFError at the end of the stream.
+        """
+
+        tree, symbols = self.read_arena()
+        return arena.to_ast(tree, factory), symbols
+
+    def __iter__(self):
+        while 1:
+            try:
+                yield self.read()
+            except EOFError:
+                return
+
+
+def narrow(column):
+    """Return column as an array of the narrowest type that holds it."""
+
+    if not column:
+        return array('b')
+    low = min(column)
+    high = max(column)
+    for typecode in TYPECODES:
+        bits = 8 * array(typecode).itemsize - 1
+        if -(1 << bits) <= low and high < (1 << bits):
+            break
+    if typecode == 'i':
+        return column
+    return array(typecode, column)
+
+
+def dump(tree, f, symbols=None):
+    """Write a single tree to a binary file object."""
+
+    Writer(f).write(tree, symbols)
+
+
+def load(f, factory=ast):
+    """Read a single tree from a binary file object as (tree, SymbolTable)."""
+
+    return Reader(f).read(factory)
+
+
+if __name__ == '__main__':
+    import scanner
+    import parser
+
+    for path in sys.argv[1:]:
+        scanner_obj = scanner.Scanner(scanner.map_file(path))
+        tree = parser.Parser(scanner_obj).parse()
+        out_file = path.rsplit('.', 1)[0] + '.mta'
+        with open(out_file, 'wb') as f:
+            dump(tree, f, scanner_obj.symbols)
+        print out_file
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# bundle.py - Bundle Mini Triangle programs into one Python module
+
+import glob
+import marshal
+import os
+import sys
+
+import scanner
+import parser
+import codegen
+
+
+# The generated module. PROGRAMS maps each program name to its marshalled
+# code object, which is a string constant of the module's own code object,
+# so importing the bundle reads a single file and unmarshals nothing but
+# that. Each program is unmarshalled the first time it is asked for.
+
+TEMPLATE = '''\
+# Mini Triangle program bundle, generated by bundle.py. Do not edit.
+
+import marshal
+from types import FunctionType
+
+VERSION = %(version)r
+
+PROGRAMS = {
+%(programs)s}
+
+functions = {}
+
+
+def get(name):
+    """Return the function for the named program.
+
+    Raise KeyError if the bundle has no such program.
+    """
+
+    try:
+        return functions[name]
+    except KeyError:
+        func = FunctionType(marshal.loads(PROGRAMS[name]), globals(), name)
+        functions[name] = func
+        return func
+
+
+def names():
+    """Return the sorted names of the bundled programs."""
+
+    return sorted(PROGRAMS)
+
+
+def run(name):
+    """Run the named program."""
+
+    return get(name)()
+'''
+
+
+def program_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def find_sources(paths):
+    """Return the source files in paths, with directories replaced by the
+    .mt files in them, in sorted order.
+    """
+
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(sorted(glob.glob(os.path.join(path, '*.mt'))))
+        else:
+            sources.append(path)
+    return sources
+
+
+def bundle(sources, out_file):
+    """Compile the source files and write them to the module out_file,
+    each under the name of its file without the extension.
+
+    Raise ValueError if two files have the same name or a program does
+    not compile, and EnvironmentError if a file cannot be read.
+    """
+
+    programs = {}
+    for path in sources:
+        name = program_name(path)
+        if name in programs:
+            raise ValueError('duplicate program name %r: %s' % (name, path))
+        try:
+            code = codegen.compile_stream(scanner.map_file(path)).func_code
+        except (scanner.ScannerError, parser.ParserError,
+                codegen.CodeGenError) as e:
+            raise ValueError('%s: %s' % (path, e))
+        except EnvironmentError:
+            raise
+        except Exception as e:
+            # Code byteplay cannot assemble, for one.
+            raise ValueError('%s: %s: %s' % (path, type(e).__name__, e))
+        programs[name] = marshal.dumps(code)
+
+    lines = ['    %r: %r,\n' % (name, programs[name])
+             for name in sorted(programs)]
+    text = TEMPLATE % {'version': codegen.VERSION,
+                       'programs': ''.join(lines)}
+    with open(out_file, 'w') as f:
+        f.write(text)
+    return sorted(programs)
+
+
+if __name__ == '__main__':
+    # bundle.py OUT.py FILE_OR_DIR...
+    if len(sys.argv) < 3:
+        print 'usage: bundle.py OUT.py FILE_OR_DIR...'
+        sys.exit(2)
+
+    out_file = sys.argv[1]
+    try:
+        names = bundle(find_sources(sys.argv[2:]), out_file)
+    except (EnvironmentError, ValueError) as e:
+        print e
+        print 'Not Bundled!'
+        sys.exit(1)
+    print '%s: %d programs' % (out_file, len(names))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+# cache.py - On-disk compile cache for Mini Triangle
+
+import errno
+import hashlib
+import imp
+import marshal
+import os
+import tempfile
+
+import codegen
+
+
+# An entry is a file named by the hex digest of its key, holding the
+# Python bytecode magic, the 20-byte SHA-1 digest of the key and the
+# marshalled code object. The key is the compiler version, the bytecode
+# magic and the source text, so entries from another version of either
+# are never found.
+
+MAGIC = imp.get_magic()
+DIGEST_SIZE = 20
+HEADER_SIZE = len(MAGIC) + DIGEST_SIZE
+SUFFIX = '.mtc'
+
+
+def source_digest(source):
+    """Return the SHA-1 digest that keys the code compiled from source."""
+
+    digest = hashlib.sha1(codegen.VERSION)
+    digest.update(MAGIC)
+    digest.update(source)
+    return digest.digest()
+
+
+class CompileCache(object):
+    """ A directory of code objects, keyed by a hash of their source.
+
+        directory: where entries are stored; created if missing.
+        max_size:  bound on the total size of the entries in bytes.
+
+        Entries are written to a temporary file and renamed into place,
+        so a reader never sees a partial entry, even with several
+        processes sharing the directory. A hit touches the entry; when a
+        new entry takes the total size over max_size, the least recently
+        used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=64 << 20):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None   # Total size of the entries, once scanned
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest.encode('hex') + SUFFIX)
+
+    def get(self, source, digest=None):
+        """Return the cached code object for source, or None."""
+
+        if digest is None:
+            digest = source_digest(source)
+        path = self.path(digest)
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(HEADER_SIZE)
+                if header == MAGIC + digest:
+                    code = marshal.load(f)
+                else:
+                    code = None
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.misses += 1
+            return None
+        except (EOFError, ValueError, TypeError):
+            code = None
+
+        if code is None:
+            # A damaged or foreign entry: drop it.
+            removed = self.remove(path)
+            if self.size is not None:
+                self.size -= removed
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return code
+
+    def put(self, source, code, digest=None):
+        """Store the code object compiled from source."""
+
+        if digest is None:
+            digest = source_digest(source)
+        data = MAGIC + digest + marshal.dumps(code)
+        path = self.path(digest)
+        fd, temp_path = tempfile.mkstemp(SUFFIX + '.tmp', '', self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # The rename replaces any entry already there, such as one
+            # another process stored first, so only the difference counts.
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.rename(temp_path, path)
+        except:
+            self.remove(temp_path)
+            raise
+
+        if self.size is None:
+            self.size = self.scan_size()
+        else:
+            self.size += len(data) - replaced
+        if self.size > self.max_size:
+            self.evict()
+
+    def compile(self, source):
+        """Return the code object for source, compiling it on a miss."""
+
+        digest = source_digest(source)
+        code = self.get(source, digest)
+        if code is None:
+            code = codegen.compile_stream(source).func_code
+            self.put(source, code, digest)
+        return code
+
+    def entries(self):
+        """Return (mtime, size, path) for every entry, oldest first."""
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def scan_size(self):
+        return sum([size for mtime, size, path in self.entries()])
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        max_size again.
+        """
+
+        entries = self.entries()
+        size = sum([size for mtime, size, path in entries])
+        for mtime, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            self.remove(path)
+            size -= entry_size
+        self.size = size
+
+    def remove(self, path):
+        """Remove the file at path if it is there, and return its size."""
+
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+
+if __name__ == '__main__':
+    import sys
+
+    compile_cache = CompileCache(sys.argv[1])
+    for mtime, size, path in compile_cache.entries():
+        print '%8d %s' % (size, os.path.basename(path))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# client.py - Client for the Mini Triangle compile server
+#
+# Only standard modules are imported here, so the client starts quickly;
+# the compiler itself stays loaded in the server (server.py).
+
+import imp
+import marshal
+import os
+import socket
+import struct
+import sys
+
+
+# A connection carries any number of requests, each answered in turn:
+#
+#   request:   kind (1 char), length (uint32), payload
+#              'S': payload is the source text
+#              'P': payload is the path of a source file, read by the server
+#   response:  status (1 char), length (uint32), payload
+#              'C': payload is the marshalled code object
+#              'E': payload is the error message
+
+FRAME = struct.Struct('<cI')
+
+SOURCE = 'S'
+PATH = 'P'
+CODE = 'C'
+ERROR = 'E'
+
+
+class CompileError(Exception):
+    """ Compile error exception, with the diagnostic the server sent. """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+def recv_exactly(sock, size):
+    """Read size bytes from sock; return '' at the end of the stream."""
+
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            if chunks:
+                raise EOFError('connection closed mid-frame')
+            return ''
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_frame(sock):
+    """Read a frame from sock as (kind, payload), or None at the end of the
+    stream.
+    """
+
+    header = recv_exactly(sock, FRAME.size)
+    if not header:
+        return None
+    kind, size = FRAME.unpack(header)
+    payload = recv_exactly(sock, size) if size else ''
+    if size and not payload:
+        raise EOFError('connection closed mid-frame')
+    return kind, payload
+
+
+def send_frame(sock, kind, payload):
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+class Client(object):
+    """ A connection to a compile server on the Unix socket at address. """
+
+    def __init__(self, address):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(address)
+
+    def request(self, kind, payload):
+        send_frame(self.sock, kind, payload)
+        response = recv_frame(self.sock)
+        if response is None:
+            raise EOFError('server closed the connection')
+        status, payload = response
+        if status == ERROR:
+            raise CompileError(payload)
+        return marshal.loads(payload)
+
+    def compile(self, source):
+        """Return the code object for source text."""
+
+        return self.request(SOURCE, source)
+
+    def compile_file(self, path):
+        """Return the code object for the source file at path."""
+
+        return self.request(PATH, os.path.abspath(path))
+
+    def close(self):
+        self.sock.close()
+
+
+def write_pyc(pyc_file, code, mtime):
+    """Write code to pyc_file with a header for the running interpreter."""
+
+    with open(pyc_file, 'wb') as pyc_f:
+        pyc_f.write(imp.get_magic())
+        pyc_f.write(struct.pack('<L', int(mtime)))
+        marshal.dump(code, pyc_f)
+
+
+if __name__ == '__main__':
+    # client.py SOCKET FILE... writes FILE's .pyc for each file
+    if len(sys.argv) < 3:
+        print 'usage: client.py SOCKET FILE...'
+        sys.exit(2)
+
+    client = Client(sys.argv[1])
+    status = 0
+    for path in sys.argv[2:]:
+        try:
+            code = client.compile_file(path)
+        except CompileError as e:
+            print '%s: %s' % (path, e)
+            status = 1
+            continue
+        pyc_file = os.path.splitext(path)[0] + '.pyc'
+        write_pyc(pyc_file, code, os.stat(path).st_mtime)
+        print pyc_file
+    client.close()
+    sys.exit(status)
@@ -2,15 +2,37 @@
 
 from byteplay import *
 from types import CodeType, FunctionType
+import getopt
+import imp
+import os
 import pprint
 import struct
-import time
 import marshal
 import sys
 
 import scanner
 import parser
 import ast
+import arena
+
+# Version of the generated code; bump it whenever the instructions emitted
+# for some tree change, so cached code objects are not reused.
+
+VERSION = '1'
+
+# Instructions for the unary and binary operators.
+
+UNARY_OPS = {'-': (UNARY_NEGATIVE, None),
+             '+': (UNARY_POSITIVE, None)}
+
+BINARY_OPS = {'+':  (BINARY_ADD, None),
+              '-':  (BINARY_SUBTRACT, None),
+              '*':  (BINARY_MULTIPLY, None),
+              '/':  (BINARY_DIVIDE, None),
+              '>':  (COMPARE_OP, '>'),
+              '<':  (COMPARE_OP, '<'),
+              '=':  (COMPARE_OP, '=='),
+              '\\': (BINARY_MODULO, None)}
 
 class CodeGenError(Exception):
     """ Code Generator Error """
@@ -21,60 +43,69 @@ class CodeGenError(Exception):
     def __str__(self):
         return 'Error at ast node: %s' % (str(self.ast))
 
-class CodeGen(object):
+class CodeGen(ast.NodeVisitor):
+    """ Generates Python bytecode for a Program.
 
-    def __init__(self, tree):
+        Each node class has a visit method that emits its instructions;
+        visits of child nodes are yielded, so the tree is walked by
+        NodeVisitor without recursion.
+    """
+
+    def __init__(self, tree, symbols=None, verbose=False):
+        ast.NodeVisitor.__init__(self)
         self.tree = tree
         self.code = []
         self.env = {}
+        # Local variable names indexed by symbol id, from the SymbolTable
+        # the tree was scanned with.
+        self.locals = symbols.names if symbols is not None else None
+        # With verbose set, the instruction list is printed before it is
+        # assembled.
+        self.verbose = verbose
 
     def generate(self):
 
         if type(self.tree) is not ast.Program:
             raise CodeGenError(self.tree)
 
-        self.gen_command(self.tree.command)
-
-        self.code.append((RETURN_VALUE, None))
-
-        pprint.pprint(self.code)
-
-        code_obj = Code(self.code, [], [], False, False, False, 'gencode', '', 0, '')
-        code = code_obj.to_code()
-        func = FunctionType(code, globals(), 'gencode')
-        return func
-
-    def gen_command(self, tree):
-
-        if type(tree) is ast.AssignCommand:
-            self.gen_assigncommand(tree)
-        elif type(tree) is ast.CallCommand:
-            self.gen_callcommand(tree)
-        elif type(tree) is ast.SequentialCommand:
-            self.gen_command(tree.command1)
-            self.gen_command(tree.command2)
-        elif type(tree) is ast.IfCommand:
-            self.gen_ifcommand(tree)
-        elif type(tree) is ast.WhileCommand:
-            self.gen_whilecommand(tree)
-        elif type(tree) is ast.LetCommand:
-            self.gen_declaration(tree.declaration)
-            self.gen_command(tree.command)
-        else:
-            raise CodeGenError(tree)
+        self.visit(self.tree.command)
+
+        return self.assemble()
+
+    def gen_unit(self, tree):
+        """Generate code for a top-level unit from Parser.parse_units."""
+
+        self.visit(tree)
 
-    def gen_assigncommand(self, tree):
-        self.gen_expr(tree.expression)
-        self.code.append((STORE_FAST, tree.variable.identifier))
+    def assemble(self):
+        """Finish the generated code and return it as a function."""
 
-    def gen_callcommand(self, tree):
+        code = self.code
+        self.code = []
+        return assemble(code, self.verbose)
+
+    def local(self, tree):
+        """Return the local variable for a Vname or declaration node."""
+
+        if tree.sym is None or self.locals is None:
+            return tree.identifier
+        return self.locals[tree.sym]
+
+    def generic_visit(self, tree):
+        raise CodeGenError(tree)
+
+    def visit_AssignCommand(self, tree):
+        yield tree.expression
+        self.code.append((STORE_FAST, self.local(tree.variable)))
+
+    def visit_CallCommand(self, tree):
         if tree.identifier == "getint":
             self.code.append((LOAD_GLOBAL, "input"))
             self.code.append((CALL_FUNCTION, 0))
-            self.code.append((STORE_FAST, tree.expression.variable.identifier))
+            self.code.append((STORE_FAST, self.local(tree.expression.variable)))
         elif tree.identifier == "putint":
             if type(tree.expression) is ast.VnameExpression:
-                self.code.append((LOAD_FAST, tree.expression.variable.identifier))
+                self.code.append((LOAD_FAST, self.local(tree.expression.variable)))
             elif type(tree.expression) is ast.IntegerExpression:
                 self.code.append((LOAD_CONST, tree.expression.value))
             else:
@@ -83,87 +114,226 @@ class CodeGen(object):
             self.code.append((PRINT_NEWLINE, None))
             self.code.append((LOAD_CONST, 0))
 
-    def gen_ifcommand(self, tree):
+    def visit_BlockCommand(self, tree):
+        for command in tree.commands:
+            yield command
+
+    def visit_SequentialCommand(self, tree):
+        yield tree.command1
+        yield tree.command2
+
+    def visit_IfCommand(self, tree):
         l1 = Label()
         l2 = Label()
-        l3 = Label()
-        self.gen_expr(tree.expression)
+        yield tree.expression
         self.code.append((POP_JUMP_IF_FALSE, l1))
-        self.gen_command(tree.command1)
+        yield tree.command1
         self.code.append((JUMP_ABSOLUTE, l2))
         self.code.append((l1, None))
-        self.gen_command(tree.command2)
+        yield tree.command2
         self.code.append((l2, None))
 
-    def gen_whilecommand(self, tree):
+    def visit_WhileCommand(self, tree):
         l1 = Label()
         l2 = Label()
-        l3 = Label()
         self.code.append((l1, None))
-        self.gen_expr(tree.expression)
+        yield tree.expression
         self.code.append((POP_JUMP_IF_FALSE, l2))
-        self.gen_command(tree.command)
+        yield tree.command
         self.code.append((JUMP_ABSOLUTE, l1))
         self.code.append((l2, None))
 
+    def visit_LetCommand(self, tree):
+        yield tree.declaration
+        yield tree.command
 
-    def gen_expr(self, tree):
-        if type(tree) is ast.IntegerExpression:
-            self.code.append((LOAD_CONST, tree.value))
-        elif type(tree) is ast.VnameExpression:
-            self.code.append((LOAD_FAST, tree.variable.identifier))
-        elif type(tree) is ast.BinaryExpression:
-            self.gen_binaryexpr(tree)
-        else:
-            raise CodeGenError(tree)
+    def visit_IntegerExpression(self, tree):
+        self.code.append((LOAD_CONST, tree.value))
 
-    def gen_binaryexpr(self, tree):
-        self.gen_expr(tree.expr1)
-        self.gen_expr(tree.expr2)
-        op = tree.oper
-        if op == '+':
-            self.code.append((BINARY_ADD, None))
-        elif op == '-':
-            self.code.append((BINARY_SUBTRACT, None))
-        elif op == '*':
-            self.code.append((BINARY_MULTIPLY, None))
-        elif op == '/':
-            self.code.append((BINARY_DIVIDE, None))
-        elif op == '>':
-            self.code.append((COMPARE_OP, '>'))
-        elif op == '<':
-            self.code.append((COMPARE_OP, '<'))
-        elif op == '=':
-            self.code.append((COMPARE_OP, '=='))
-        elif op == '\\':
-            self.code.append((BINARY_MODULO, None))
-        else:
-            raise CodeGenError(op)
-
-    def gen_declaration(self, tree):
-        if type(tree) is ast.ConstDeclaration:
-            self.gen_constdecl(tree)
-        elif type(tree) is ast.VarDeclaration:
-            self.gen_vardecl(tree)
-        elif type(tree) is ast.SequentialDeclaration:
-            self.gen_declaration(tree.decl1)
-            self.gen_declaration(tree.decl2)
-        else:
+    def visit_VnameExpression(self, tree):
+        self.code.append((LOAD_FAST, self.local(tree.variable)))
+
+    def visit_UnaryExpression(self, tree):
+        yield tree.expression
+        try:
+            self.code.append(UNARY_OPS[tree.operator])
+        except KeyError:
             raise CodeGenError(tree)
 
-    def gen_constdecl(self, tree):
-        self.gen_expr(tree.expression)
-        self.code.append((STORE_FAST, tree.identifier))
+    def visit_BinaryExpression(self, tree):
+        yield tree.expr1
+        yield tree.expr2
+        try:
+            self.code.append(BINARY_OPS[tree.oper])
+        except KeyError:
+            raise CodeGenError(tree.oper)
+
+    def visit_ConstDeclaration(self, tree):
+        yield tree.expression
+        self.code.append((STORE_FAST, self.local(tree)))
 
-    def gen_vardecl(self, tree):
+    def visit_VarDeclaration(self, tree):
         pass
         # self.code.append((LOAD_CONST, tree.type_denoter.identifier))
         # self.code.append((STORE_FAST, tree.identifier))
 
+    def visit_DeclarationList(self, tree):
+        for declaration in tree.declarations:
+            yield declaration
+
+    def visit_SequentialDeclaration(self, tree):
+        yield tree.decl1
+        yield tree.decl2
+
+
+class ArenaCodeGen(object):
+    """ Code generator for a tree stored in an arena.Arena.
 
+        Generates the same code as CodeGen, walking the arena's columns by
+        node index instead of ast objects. Node fields are laid out as in
+        arena.LAYOUT. Pending work is kept on an explicit stack of node
+        indexes and instructions, so tree depth is not limited by
+        recursion.
+    """
 
+    def __init__(self, tree, symbols=None, verbose=False):
+        self.tree = tree
+        # Local variable names indexed by symbol id, as in CodeGen.
+        self.locals = symbols.names if symbols is not None else None
+        self.verbose = verbose
+
+    def generate(self):
+        tree = self.tree
+        kinds, a, b, c = tree.kinds, tree.a, tree.b, tree.c
+        value_of = tree.value_of
+        local = self.local
+
+        root = tree.root
+        if kinds[root] != arena.K_PROGRAM:
+            raise CodeGenError(root)
+
+        code = []
+        emit = code.append
+        # Items are popped in order: an int is a node to generate, anything
+        # else an instruction to emit. A node pushes its children and
+        # instructions in reverse.
+        stack = [a[root]]
+        pop = stack.pop
+        push = stack.extend
+        while stack:
+            item = pop()
+            if type(item) is not int:
+                emit(item)
+                continue
+            index = item
+            kind = kinds[index]
+
+            if kind == arena.K_INTEGER:
+                emit((LOAD_CONST, value_of(index)))
+            elif kind == arena.K_VNAME_EXPR:
+                emit((LOAD_FAST, local(a[index])))
+            elif kind == arena.K_BINARY:
+                try:
+                    op = BINARY_OPS[value_of(index)]
+                except KeyError:
+                    raise CodeGenError(index)
+                push((op, b[index], a[index]))
+            elif kind == arena.K_UNARY:
+                try:
+                    op = UNARY_OPS[value_of(index)]
+                except KeyError:
+                    raise CodeGenError(index)
+                push((op, a[index]))
+            elif kind == arena.K_ASSIGN:
+                push(((STORE_FAST, local(a[index])), b[index]))
+            elif kind == arena.K_CALL:
+                self.gen_callcommand(index, emit)
+            elif (kind == arena.K_BLOCK or kind == arena.K_SEQ_COMMAND or
+                  kind == arena.K_DECL_LIST or kind == arena.K_SEQ_DECL):
+                children = tree.children(index)
+                children.reverse()
+                push(children)
+            elif kind == arena.K_IF:
+                l1 = Label()
+                l2 = Label()
+                push(((l2, None), c[index], (l1, None), (JUMP_ABSOLUTE, l2),
+                      b[index], (POP_JUMP_IF_FALSE, l1), a[index]))
+            elif kind == arena.K_WHILE:
+                l1 = Label()
+                l2 = Label()
+                emit((l1, None))
+                push(((l2, None), (JUMP_ABSOLUTE, l1), b[index],
+                      (POP_JUMP_IF_FALSE, l2), a[index]))
+            elif kind == arena.K_LET:
+                push((b[index], a[index]))
+            elif kind == arena.K_CONST:
+                push(((STORE_FAST, local(index)), a[index]))
+            elif kind == arena.K_VAR:
+                pass
+            else:
+                raise CodeGenError(index)
+
+        return assemble(code, self.verbose)
+
+    def local(self, index):
+        """Return the local variable for a Vname or declaration node."""
+
+        name = self.tree.value_of(index)
+        sym = self.tree.sym_of(index)
+        if sym is None or self.locals is None:
+            return name
+        return self.locals[sym]
+
+    def gen_callcommand(self, index, emit):
+        tree = self.tree
+        identifier = tree.value_of(index)
+        exp = tree.a[index]
+        kind = tree.kinds[exp]
+        if identifier == "getint":
+            if kind != arena.K_VNAME_EXPR:
+                raise CodeGenError(exp)
+            emit((LOAD_GLOBAL, "input"))
+            emit((CALL_FUNCTION, 0))
+            emit((STORE_FAST, self.local(tree.a[exp])))
+        elif identifier == "putint":
+            if kind == arena.K_VNAME_EXPR:
+                emit((LOAD_FAST, self.local(tree.a[exp])))
+            elif kind == arena.K_INTEGER:
+                emit((LOAD_CONST, tree.value_of(exp)))
+            else:
+                raise CodeGenError(exp)
+            emit((PRINT_ITEM, None))
+            emit((PRINT_NEWLINE, None))
+            emit((LOAD_CONST, 0))
 
 
+def assemble(code, verbose=False):
+    """Finish a list of instructions and return it as a function."""
+
+    code.append((RETURN_VALUE, None))
+
+    if verbose:
+        pprint.pprint(code)
+
+    code_obj = Code(code, [], [], False, False, False, 'gencode', '', 0, '')
+    return FunctionType(code_obj.to_code(), globals(), 'gencode')
+
+
+def compile_stream(source, verbose=False):
+    """ Compile Mini Triangle source text to a function.
+
+        Tokens are parsed as they are scanned, and each top-level unit is
+        lowered to instructions as soon as it is parsed, so neither the
+        token list nor the whole tree is ever held in memory.
+    """
+
+    scanner_obj = scanner.Scanner(source)
+    parser_obj = parser.Parser(scanner_obj)
+    cg = CodeGen(None, scanner_obj.symbols, verbose)
+    for unit in parser_obj.parse_units():
+        cg.gen_unit(unit)
+    return cg.assemble()
+
 
 if __name__ == '__main__':
     progs = [ """let
@@ -200,44 +370,47 @@ in
 
               """]
 
-    arg = sys.argv[1]
-
-    f = open(arg, 'r')
-    prog = f.read()
-    print '=============='
-    print prog
-    
-    scanner_obj = scanner.Scanner(prog)
-    
-    try:
-        tokens = scanner_obj.scan()
-        print tokens
-    except scanner.ScannerError as e:
-        print e
-        
-
-    parser_obj = parser.Parser(tokens)
-
-    try:
-        tree = parser_obj.parse()
-        print tree
-    except parser.ParserError as e:
-        print e
-        print 'Not Parsed!'
-        
-
-    cg = CodeGen(tree)
-    code = cg.generate()
-    # print code()
-
-    # write code to file
-    arg = arg.split('.')
-    name = arg[0]
-    pyc_file = name + '.pyc'
-    print pyc_file
-
-    with open(pyc_file,'wb') as pyc_f:
-        magic = 0x03f30d0a
-        pyc_f.write(struct.pack(">L",magic))
-        pyc_f.write(struct.pack(">L",time.time()))
-        marshal.dump(code.func_code, pyc_f)
+    # With -v the tokens, tree and instructions are printed; otherwise
+    # each file is compiled in a single streaming pass. With -c DIR,
+    # code objects are looked up in and saved to a compile cache in DIR.
+    opts, args = getopt.getopt(sys.argv[1:], 'vc:')
+    opts = dict(opts)
+    verbose = '-v' in opts
+    compile_cache = None
+    if '-c' in opts:
+        import cache
+        compile_cache = cache.CompileCache(opts['-c'])
+
+    for arg in args:
+        prog = scanner.map_file(arg)
+        print '=============='
+        print arg
+
+        try:
+            if verbose:
+                scanner_obj = scanner.Scanner(prog)
+                tokens = scanner_obj.scan()
+                print tokens
+                tree = parser.Parser(tokens).parse()
+                ast.dump(tree, indent=2)
+                print
+                code = CodeGen(tree, scanner_obj.symbols, verbose).generate()
+                code = code.func_code
+            elif compile_cache is not None:
+                code = compile_cache.compile(prog)
+            else:
+                code = compile_stream(prog).func_code
+        except (scanner.ScannerError, parser.ParserError) as e:
+            print e
+            print 'Not Parsed!'
+            sys.exit(1)
+
+        # write code to file, with the header of the running interpreter
+        # and the source's mtime, so python will run it
+        pyc_file = os.path.splitext(arg)[0] + '.pyc'
+        print pyc_file
+
+        with open(pyc_file,'wb') as pyc_f:
+            pyc_f.write(imp.get_magic())
+            pyc_f.write(struct.pack("<L", int(os.stat(arg).st_mtime)))
+            marshal.dump(code, pyc_f)
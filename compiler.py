@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# compiler.py - Embedding API for the Mini Triangle compiler
+
+from collections import OrderedDict
+from types import FunctionType
+
+import codegen
+import cache
+
+
+class Compiler(object):
+    """ Compiles Mini Triangle programs to functions, keeping the most
+        recently used ones in memory.
+
+        capacity:   the number of programs kept; at least 1.
+        disk_cache: an optional cache.CompileCache consulted on a miss,
+                    before the program is compiled.
+
+        Programs are keyed by cache.source_digest, so a hit costs one hash
+        of the source and skips the scanner, parser and code generator.
+        hits and misses count the lookups of compile().
+    """
+
+    def __init__(self, capacity=128, disk_cache=None):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = capacity
+        self.disk_cache = disk_cache
+        self.functions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, source):
+        """Return a function that runs the program in source.
+
+        Raise scanner.ScannerError or parser.ParserError if source is not
+        a valid program; failures are not cached.
+        """
+
+        digest = cache.source_digest(source)
+        functions = self.functions
+        try:
+            func = functions.pop(digest)
+        except KeyError:
+            self.misses += 1
+            func = self.build(source, digest)
+            if len(functions) >= self.capacity:
+                functions.popitem(last=False)
+        else:
+            self.hits += 1
+        functions[digest] = func
+        return func
+
+    def build(self, source, digest):
+        if self.disk_cache is None:
+            return codegen.compile_stream(source)
+        code = self.disk_cache.get(source, digest)
+        if code is None:
+            func = codegen.compile_stream(source)
+            self.disk_cache.put(source, func.func_code, digest)
+            return func
+        return FunctionType(code, vars(codegen), 'gencode')
+
+    def __len__(self):
+        return len(self.functions)
+
+    def __contains__(self, source):
+        return cache.source_digest(source) in self.functions
+
+    def clear(self):
+        """Drop every cached program and reset the counters."""
+
+        self.functions.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Return (hits, misses, size, capacity)."""
+
+        return self.hits, self.misses, len(self.functions), self.capacity
+
+
+# The Compiler behind the module-level compile().
+
+default_compiler = Compiler()
+
+
+def compile(source):
+    """Return a function that runs the program in source, using the
+    default Compiler's cache.
+    """
+
+    return default_compiler.compile(source)
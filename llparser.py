@@ -0,0 +1,768 @@
+#!/usr/bin/env python
+#
+# Table-driven LL(1) parser for Mini Triangle
+
+import scanner as mt_scanner
+import ast
+
+
+class ParserError(Exception):
+    """ Parser error exception.
+
+        pos: position in the input text where the error occurred.
+        type: bad token type
+        lines: LineIndex of the input text, if known.
+    """
+
+    def __init__(self, pos, type, lines=None):
+        self.pos = pos
+        self.type = type
+        self.lines = lines
+
+    def __str__(self):
+        return '(Found bad token %s at %s)' % (mt_scanner.TOKENS[self.type],
+                                               mt_scanner.format_pos(self.pos, self.lines))
+
+
+class GrammarError(Exception):
+    """ Grammar error exception.
+
+        Raised when a grammar is not LL(1).
+    """
+
+    def __init__(self, nonterminal, terminal, rhs1, rhs2):
+        self.nonterminal = nonterminal
+        self.terminal = terminal
+        self.rhs1 = rhs1
+        self.rhs2 = rhs2
+
+    def __str__(self):
+        return 'GrammarError: %s has two productions for %s: %s and %s' % (
+            self.nonterminal, terminal_name(self.terminal),
+            ' '.join(map(symbol_name, self.rhs1)) or '<empty>',
+            ' '.join(map(symbol_name, self.rhs2)) or '<empty>')
+
+
+# Terminals are token types.
+
+TERMINALS = mt_scanner.TOKENS
+
+# Tokens whose values are pushed on the value stack when matched.
+
+VALUE_TERMINALS = frozenset([mt_scanner.TK_IDENTIFIER,
+                             mt_scanner.TK_INTLITERAL])
+
+# Binding strength of each binary Operator, loosest first. A unary
+# Operator binds tighter than all of them, and an open parenthesis is kept
+# on the operator stack below everything else.
+
+PREC_PAREN  = 0
+PREC_BINARY = 1
+PREC_UNARY  = 4
+
+PRECEDENCE = {'=':  1, '<': 1, '>': 1,
+              '+':  2, '-': 2,
+              '*':  3, '/': 3, '\\': 3}
+
+
+# Semantic actions. Each one pops the values of the symbols before it in
+# its production off parser.values and pushes the node built from them.
+
+def act_program(parser):
+    values = parser.values
+    values[-1] = parser.factory.Program(values[-1])
+
+def act_assign(parser):
+    values = parser.values
+    exp = values.pop()
+    name, sym = values[-1]
+    factory = parser.factory
+    values[-1] = factory.AssignCommand(factory.Vname(name, sym), exp)
+
+def act_call(parser):
+    values = parser.values
+    exp = values.pop()
+    name, sym = values[-1]
+    values[-1] = parser.factory.CallCommand(name, exp)
+
+def act_if(parser):
+    values = parser.values
+    comm2 = values.pop()
+    comm1 = values.pop()
+    values[-1] = parser.factory.IfCommand(values[-1], comm1, comm2)
+
+def act_while(parser):
+    values = parser.values
+    comm = values.pop()
+    values[-1] = parser.factory.WhileCommand(values[-1], comm)
+
+def act_let(parser):
+    values = parser.values
+    comm = values.pop()
+    decls = values[-1]
+    if len(decls) == 1:
+        decl = decls[0]
+    else:
+        decl = parser.factory.DeclarationList(decls)
+    values[-1] = parser.factory.LetCommand(decl, comm)
+
+def act_block(parser):
+    values = parser.values
+    comms = values[-1]
+    if len(comms) == 1:
+        values[-1] = comms[0]
+    else:
+        values[-1] = parser.factory.BlockCommand(comms)
+
+def act_list(parser):
+    parser.values.append([])
+
+def act_append(parser):
+    values = parser.values
+    item = values.pop()
+    values[-1].append(item)
+
+def act_const(parser):
+    values = parser.values
+    exp = values.pop()
+    name, sym = values[-1]
+    values[-1] = parser.factory.ConstDeclaration(name, exp, sym)
+
+def act_var(parser):
+    values = parser.values
+    type_name, type_sym = values.pop()
+    name, sym = values[-1]
+    factory = parser.factory
+    values[-1] = factory.VarDeclaration(name, factory.TypeDenoter(type_name), sym)
+
+def act_span(parser):
+    node = parser.values[-1]
+    node.start = parser.starts.pop()
+    node.end = parser.curtoken.pos
+
+
+# Directives, which LLParser pushes or finds in its tables beside the
+# semantic actions. act_expression and act_unit are run by the driver
+# itself; act_expression is also kept in a table that only recognizes.
+
+def act_expression(parser):
+    """Parse an Expression with LLParser.parse_expression."""
+
+def act_unit(parser):
+    """Generate the finished unit from LLParser.parse_units."""
+
+def act_close(parser):
+    parser.frames.pop()
+
+
+# The grammar of the Parser docstring, left-factored and with the left
+# recursion of Expression, Command and Declaration removed. Strings are
+# nonterminals, ints are terminals and functions are semantic actions.
+#
+# The Expression productions only give the FIRST and FOLLOW sets of an
+# Expression: the parse tables replace each Expression with act_expression,
+# which parses it by operator precedence (see PRECEDENCE) in one loop.
+
+T = mt_scanner
+
+GRAMMAR = [
+    ('Program',            ['single-Command', T.TK_EOT, act_program]),
+
+    ('single-Command',     [T.TK_IDENTIFIER, 'Identifier-Command']),
+    ('single-Command',     [T.TK_IF, 'Expression', T.TK_THEN, 'single-Command',
+                            'Else-Separator', T.TK_ELSE, 'single-Command',
+                            act_if]),
+    ('single-Command',     [T.TK_WHILE, 'Expression', T.TK_DO, 'single-Command',
+                            act_while]),
+    ('single-Command',     [T.TK_LET, act_list, 'Declaration', T.TK_IN,
+                            'single-Command', act_let]),
+    ('single-Command',     [T.TK_BEGIN, act_list, 'Command', T.TK_END,
+                            act_block]),
+
+    ('Identifier-Command', [T.TK_BECOMES, 'Expression', act_assign]),
+    ('Identifier-Command', [T.TK_LPAREN, 'Expression', T.TK_RPAREN, act_call]),
+
+    ('Else-Separator',     [T.TK_SEMICOLON]),
+    ('Else-Separator',     []),
+
+    ('Command',            ['single-Command', act_append, 'Command-Rest']),
+    ('Command-Rest',       [T.TK_SEMICOLON, 'Command-Tail']),
+    ('Command-Rest',       []),
+    ('Command-Tail',       ['Command']),
+    ('Command-Tail',       []),
+
+    ('Declaration',        ['single-Declaration', act_append,
+                            'Declaration-Rest']),
+    ('Declaration-Rest',   [T.TK_SEMICOLON, 'Declaration-Tail']),
+    ('Declaration-Rest',   []),
+    ('Declaration-Tail',   ['Declaration']),
+    ('Declaration-Tail',   []),
+
+    ('single-Declaration', [T.TK_CONST, T.TK_IDENTIFIER, T.TK_IS, 'Expression',
+                            act_const]),
+    ('single-Declaration', [T.TK_VAR, T.TK_IDENTIFIER, T.TK_COLON,
+                            T.TK_IDENTIFIER, act_var]),
+
+    ('Expression',         ['primary-Expression', 'Expression-Rest']),
+    ('Expression-Rest',    [T.TK_OPERATOR, 'primary-Expression',
+                            'Expression-Rest']),
+    ('Expression-Rest',    []),
+
+    ('primary-Expression', [T.TK_INTLITERAL]),
+    ('primary-Expression', [T.TK_IDENTIFIER]),
+    ('primary-Expression', [T.TK_LPAREN, 'Expression', T.TK_RPAREN]),
+    ('primary-Expression', [T.TK_OPERATOR, 'primary-Expression']),
+]
+
+del T
+
+# Nonterminals whose nodes get a source span. They are also the units of
+# error recovery, each replaced by its Error node after a syntax error.
+
+SPANNED = frozenset(['single-Command', 'single-Declaration'])
+
+ERROR_NODES = {'single-Command':     'ErrorCommand',
+               'single-Declaration': 'ErrorDeclaration'}
+
+EPSILON = None
+
+
+def is_terminal(symbol):
+    return type(symbol) is int
+
+def is_nonterminal(symbol):
+    return type(symbol) is str
+
+def terminal_name(terminal):
+    if terminal is EPSILON:
+        return '<empty>'
+    return TERMINALS[terminal]
+
+def symbol_name(symbol):
+    if is_terminal(symbol):
+        return terminal_name(symbol)
+    if is_nonterminal(symbol):
+        return symbol
+    return '#' + symbol.__name__[4:]
+
+
+def first_sets(grammar):
+    """Return {nonterminal: FIRST set}; EPSILON marks a nullable one."""
+
+    first = dict((lhs, set()) for lhs, rhs in grammar)
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs in grammar:
+            new = first_of(rhs, first)
+            if not new <= first[lhs]:
+                first[lhs] |= new
+                changed = True
+    return first
+
+
+def first_of(symbols, first):
+    """Return the FIRST set of a sequence of grammar symbols."""
+
+    result = set()
+    for symbol in symbols:
+        if is_terminal(symbol):
+            result.add(symbol)
+            return result
+        if is_nonterminal(symbol):
+            result |= first[symbol] - set([EPSILON])
+            if EPSILON not in first[symbol]:
+                return result
+    result.add(EPSILON)
+    return result
+
+
+def follow_sets(grammar, first, start='Program'):
+    """Return {nonterminal: FOLLOW set}."""
+
+    follow = dict((lhs, set()) for lhs, rhs in grammar)
+    follow[start].add(mt_scanner.TK_EOT)
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs in grammar:
+            for i, symbol in enumerate(rhs):
+                if not is_nonterminal(symbol):
+                    continue
+                new = first_of(rhs[i + 1:], first)
+                if EPSILON in new:
+                    new.discard(EPSILON)
+                    new |= follow[lhs]
+                if not new <= follow[symbol]:
+                    follow[symbol] |= new
+                    changed = True
+    return follow
+
+
+def build_table(grammar, start='Program'):
+    """Build the LL(1) dispatch table of grammar.
+
+    Return {nonterminal: {terminal: symbols}}, where symbols is the
+    production's right-hand side reversed, ready to be pushed on the parse
+    stack. Raise GrammarError if the grammar is not LL(1).
+    """
+
+    first = first_sets(grammar)
+    follow = follow_sets(grammar, first, start)
+    table = dict((lhs, {}) for lhs, rhs in grammar)
+    for lhs, rhs in grammar:
+        lookahead = first_of(rhs, first)
+        if EPSILON in lookahead:
+            lookahead.discard(EPSILON)
+            lookahead |= follow[lhs]
+        row = table[lhs]
+        for terminal in lookahead:
+            if terminal in row:
+                raise GrammarError(lhs, terminal, rhs, row[terminal][::-1])
+            row[terminal] = rhs[::-1]
+    return table
+
+
+def expand_table(table):
+    """Return table made ready for LLParser.
+
+    Each Expression is replaced by act_expression. A nonterminal on top of
+    a pushed right-hand side is expanded on the same lookahead as the entry
+    itself, so these expansions are done here, once, instead of one parse
+    step each; spanned nonterminals are left for the parser, which records
+    where they start.
+    """
+
+    def directives(symbols):
+        return [act_expression if symbol == 'Expression' else symbol
+                for symbol in symbols]
+
+    expanded = {}
+    for lhs, row in table.iteritems():
+        new_row = expanded[lhs] = {}
+        for terminal, symbols in row.iteritems():
+            symbols = directives(symbols)
+            while (symbols and is_nonterminal(symbols[-1]) and
+                   symbols[-1] not in SPANNED):
+                rhs = table[symbols[-1]].get(terminal)
+                if rhs is None:
+                    break
+                symbols.pop()
+                symbols.extend(directives(rhs))
+            new_row[terminal] = symbols
+    return expanded
+
+
+def strip_actions(table):
+    """Return table without its semantic actions, for recognizing only."""
+
+    return dict((lhs, dict((terminal, [symbol for symbol in symbols
+                                       if not callable(symbol) or
+                                       symbol is act_expression])
+                           for terminal, symbols in row.iteritems()))
+                for lhs, row in table.iteritems())
+
+
+def insertions(grammar, first):
+    """Return {(nonterminal, terminal): inserted} for error recovery.
+
+    A nonterminal that cannot start with terminal is taken to have lost
+    the token inserted when it has a production nonterminal -> inserted
+    rest, with terminal in FIRST(rest), and no other production does.
+    Only tokens without a value are ever inserted.
+    """
+
+    found = {}
+    for lhs, rhs in grammar:
+        if (not rhs or not is_terminal(rhs[0]) or
+                rhs[0] in VALUE_TERMINALS or rhs[0] == mt_scanner.TK_EOT):
+            continue
+        lookahead = first_of(rhs[1:], first) - first[lhs]
+        lookahead.discard(EPSILON)
+        for terminal in lookahead:
+            found.setdefault((lhs, terminal), []).append(rhs[0])
+    return dict((key, inserted[0]) for key, inserted in found.iteritems()
+                if len(inserted) == 1)
+
+
+def containers(grammar, first):
+    """Return the (nonterminal, terminal) pairs on which a spanned
+    nonterminal expands to a production that collects a list, which are
+    let and begin.
+    """
+
+    return frozenset((lhs, terminal) for lhs, rhs in grammar
+                     if lhs in SPANNED and act_list in rhs
+                     for terminal in first_of(rhs, first))
+
+
+FIRST = first_sets(GRAMMAR)
+FOLLOW = follow_sets(GRAMMAR, FIRST)
+TABLE = build_table(GRAMMAR)
+EXPANDED_TABLE = expand_table(TABLE)
+RECOGNIZE_TABLE = strip_actions(EXPANDED_TABLE)
+INSERTIONS = insertions(GRAMMAR, FIRST)
+CONTAINERS = containers(GRAMMAR, FIRST)
+
+
+class LLParser(object):
+    """ Parse Mini Triangle with the generated LL(1) table.
+
+        The parse is driven by an explicit stack of grammar symbols, so
+        each step is one table lookup on the current token and nesting
+        depth is not limited by recursion; each Expression is parsed by
+        operator precedence in one loop. Nodes are built by calling the
+        classes of a node factory by name.
+
+        With recover set, a syntax error is recorded in errors and the
+        parse goes on past it (see recover), so one pass reports them all.
+    """
+
+    def __init__(self, tokens, factory=ast, curtoken=None, recover=False):
+        # tokens may be a list or any iterator of Tokens ending in TK_EOT.
+        # A Parser hands over its iterator with the token it has already
+        # taken from it as curtoken.
+        self.tokens = iter(tokens)
+        if curtoken is None:
+            curtoken = next(self.tokens)
+        self.curtoken = curtoken
+        self.factory = factory
+        # With a recognize_only factory such as parser.NULL_FACTORY the
+        # input is only recognized: no values are kept and no semantic
+        # actions are run.
+        self.building = not getattr(factory, 'recognize_only', False)
+        if self.building:
+            self.unit_table = EXPANDED_TABLE
+        else:
+            self.unit_table = RECOGNIZE_TABLE
+        self.table = self.unit_table   # The table in use
+        self.build = self.building     # Whether values are being built
+        self.recovering = recover
+        self.values = []   # Semantic values of the matched symbols
+        self.starts = []   # Start positions of the open spanned nodes
+        self.frames = []   # Recovery frames of the open spanned nodes
+        self.errors = []
+        self.resync_pos = None
+
+    def parse(self, start='Program'):
+        """Parse a start phrase and return its node, or None when only
+        recognizing. Unless start is Program, parsing stops after the
+        phrase without checking for EOT.
+        """
+
+        for unit in self.run([start], False):
+            pass
+        if self.build:
+            return self.values.pop()
+        return None
+
+    def parse_units(self):
+        """Parse a Program, generating its units one at a time.
+
+        The let and begin commands on the way down from the Program (see
+        CONTAINERS) are only recognized. Every other single-Command and
+        single-Declaration in them is a unit, generated as soon as it has
+        been parsed, so a consumer can drop each one before the next is
+        read. Syntax errors are raised.
+        """
+
+        self.recovering = False
+        self.table = RECOGNIZE_TABLE
+        self.build = False
+        return self.run(['Program'], True)
+
+    def run(self, stack, units):
+        """Parse until stack is empty. With units set, the stack starts out
+        recognizing, and each unit is generated as it is finished.
+        """
+
+        values = self.values
+        recovering = self.recovering
+        skeleton = units
+        next_token = self.tokens.next
+        pop = stack.pop
+        TK_IDENTIFIER = mt_scanner.TK_IDENTIFIER
+        TK_EOT = mt_scanner.TK_EOT
+        if self.build or recovering or units:
+            spanned = SPANNED
+        else:
+            spanned = frozenset()
+
+        while stack:
+            table = self.table
+            build = self.build
+            token = self.curtoken
+            terminal = token.type
+            try:
+                while stack:
+                    symbol = pop()
+                    kind = type(symbol)
+                    if kind is int:
+                        if symbol != terminal:
+                            stack.append(symbol)
+                            raise self.token_error()
+                        if build and terminal in VALUE_TERMINALS:
+                            if terminal == TK_IDENTIFIER:
+                                values.append((token.val, token.sym))
+                            else:
+                                values.append(token.val)
+                        if terminal != TK_EOT:
+                            self.curtoken = token = next_token()
+                            terminal = token.type
+                    elif kind is str:
+                        rhs = table[symbol].get(terminal)
+                        if rhs is None:
+                            stack.append(symbol)
+                            raise self.token_error()
+                        if symbol in spanned:
+                            if (skeleton and
+                                    (symbol, terminal) not in CONTAINERS):
+                                skeleton = False
+                                stack.append(act_unit)
+                                self.table = table = self.unit_table
+                                self.build = build = self.building
+                                rhs = table[symbol][terminal]
+                            self.open(symbol, stack)
+                        stack.extend(rhs)
+                    elif symbol is act_expression:
+                        try:
+                            node = self.parse_expression()
+                        except ParserError:
+                            stack.append(symbol)
+                            raise
+                        if build:
+                            values.append(node)
+                        token = self.curtoken
+                        terminal = token.type
+                    elif symbol is act_unit:
+                        skeleton = True
+                        self.table = table = RECOGNIZE_TABLE
+                        self.build = build = False
+                        if self.building:
+                            yield values.pop()
+                        else:
+                            yield None
+                    else:
+                        symbol(self)
+            except ParserError as e:
+                if not recovering:
+                    raise
+                self.recover(e, stack)
+
+    def open(self, symbol, stack):
+        """Start the node of the spanned nonterminal symbol, which is about
+        to be expanded on stack.
+        """
+
+        if self.build:
+            self.starts.append(self.curtoken.pos)
+            stack.append(act_span)
+        if self.recovering:
+            self.frames.append((len(stack), len(self.values),
+                                len(self.starts), symbol))
+            stack.append(act_close)
+
+    def parse_expression(self):
+        """ Expression ::=  primary-Expression
+                        |   Expression Operator primary-Expression
+
+            Operators are applied by precedence (see PRECEDENCE), all
+            binary operators associate to the left, and a unary Operator
+            binds tighter than any binary one. The whole expression,
+            including parenthesised subexpressions, is parsed in one loop
+            with explicit operand and operator stacks, so each operand
+            costs one step and nesting depth is not limited by recursion.
+        """
+
+        operands = []
+        operators = []   # (precedence, operator) pairs; see PREC_*
+        depth = 0        # number of open parentheses
+
+        # Tokens taken inside the loop are never TK_EOT, so they are
+        # advanced over directly.
+        next_token = self.tokens.next
+        reduce = self.reduce_expression
+        factory = self.factory
+        TK_INTLITERAL = mt_scanner.TK_INTLITERAL
+        TK_IDENTIFIER = mt_scanner.TK_IDENTIFIER
+        TK_OPERATOR = mt_scanner.TK_OPERATOR
+
+        token = self.curtoken
+        while 1:
+            # Operand position: unary operators and '(' may precede a
+            # primary-Expression.
+            type = token.type
+            if type == TK_IDENTIFIER:
+                vname = factory.Vname(token.val, token.sym)
+                operands.append(factory.VnameExpression(vname))
+            elif type == TK_INTLITERAL:
+                operands.append(factory.IntegerExpression(token.val))
+            elif type == TK_OPERATOR:
+                operators.append((PREC_UNARY, token.val))
+                self.curtoken = token = next_token()
+                continue
+            elif type == mt_scanner.TK_LPAREN:
+                operators.append((PREC_PAREN, None))
+                depth += 1
+                self.curtoken = token = next_token()
+                continue
+            else:
+                raise self.token_error()
+            self.curtoken = token = next_token()
+
+            # Operator position: close parentheses until a binary operator
+            # starts the next operand or the expression ends.
+            while 1:
+                if token.type == TK_OPERATOR:
+                    oper = token.val
+                    prec = PRECEDENCE[oper]
+                    if operators and operators[-1][0] >= prec:
+                        reduce(operands, operators, prec)
+                    operators.append((prec, oper))
+                    self.curtoken = token = next_token()
+                    break
+                elif depth:
+                    if token.type != mt_scanner.TK_RPAREN:
+                        raise self.token_error()
+                    self.curtoken = token = next_token()
+                    reduce(operands, operators, PREC_BINARY)
+                    operators.pop()
+                    depth -= 1
+                else:
+                    if operators:
+                        reduce(operands, operators, PREC_BINARY)
+                    return operands[0]
+
+    def reduce_expression(self, operands, operators, prec):
+        """ Build nodes for the stacked operators that bind at least as
+            tightly as prec.
+        """
+
+        factory = self.factory
+        while operators and operators[-1][0] >= prec:
+            prec_top, oper = operators.pop()
+            if prec_top == PREC_UNARY:
+                operands[-1] = factory.UnaryExpression(oper, operands[-1])
+            else:
+                e2 = operands.pop()
+                operands[-1] = factory.BinaryExpression(operands[-1], oper, e2)
+
+    def recover(self, error, stack):
+        """ Record error and get the parse going again, in panic mode.
+
+            The symbol on top of stack is the one that failed on the
+            current token. A missing token is inserted (see INSERTIONS) if
+            that is enough to go on. Otherwise an Expression that failed is
+            replaced by an ErrorExpression, and tokens are skipped until
+            the stack can go on with one, or the innermost open spanned
+            node, whose FOLLOW set holds the token, can be closed as its
+            Error node. An error at the token parsing resumed from after
+            the previous one is not recorded again.
+        """
+
+        token = self.curtoken
+        if token.pos != self.resync_pos:
+            self.errors.append(error)
+            if self.insert(stack, token.type):
+                self.resync_pos = token.pos
+                return
+
+        symbol = stack[-1]
+        opened = None
+        if symbol is act_expression:
+            stack.pop()
+            if self.build:
+                self.values.append(self.factory.ErrorExpression(error))
+        elif symbol in SPANNED:
+            # A node that failed on its first token gets its frame now, to
+            # be closed as an Error node like one that failed inside.
+            stack.pop()
+            self.open(symbol, stack)
+            stack.append(symbol)
+            opened = symbol
+
+        frames = self.frames
+        while 1:
+            terminal = self.curtoken.type
+            if self.accepts(stack, len(stack), terminal):
+                if opened is not None:
+                    stack.pop()
+                    stack.extend(self.table[opened][terminal])
+                break
+            for i in xrange(len(frames) - 1, -1, -1):
+                base, nvalues, nstarts, nonterminal = frames[i]
+                if (terminal in FOLLOW[nonterminal] and
+                        self.accepts(stack, base, terminal)):
+                    break
+            else:
+                if terminal == mt_scanner.TK_EOT:
+                    raise error
+                self.curtoken = next(self.tokens)
+                continue
+            del stack[base:]
+            del frames[i:]
+            if self.build:
+                del self.values[nvalues:]
+                del self.starts[nstarts:]
+                node = getattr(self.factory, ERROR_NODES[nonterminal])(error)
+                self.values.append(node)
+            break
+        self.resync_pos = self.curtoken.pos
+
+    def insert(self, stack, terminal):
+        """Insert the token that the symbol on top of stack is missing
+        before terminal, if there is one. Return whether it was inserted.
+        """
+
+        symbol = stack[-1]
+        if type(symbol) is int:
+            if (symbol in VALUE_TERMINALS or symbol == mt_scanner.TK_EOT or
+                    not self.accepts(stack, len(stack) - 1, terminal)):
+                return False
+            stack.pop()
+            return True
+        inserted = INSERTIONS.get((symbol, terminal))
+        if inserted is None:
+            return False
+        stack.pop()
+        if symbol in SPANNED:
+            self.open(symbol, stack)
+        rhs = self.table[symbol][inserted]
+        stack.extend(rhs[:-1])
+        return True
+
+    def accepts(self, stack, top, terminal):
+        """Return whether the symbols in stack[:top] can go on with
+        terminal.
+        """
+
+        for i in xrange(top - 1, -1, -1):
+            symbol = stack[i]
+            kind = type(symbol)
+            if kind is int:
+                return symbol == terminal
+            if kind is str:
+                first = FIRST[symbol]
+            elif symbol is act_expression:
+                first = FIRST['Expression']
+            else:
+                continue
+            if terminal in first:
+                return True
+            if EPSILON not in first:
+                return False
+        return False
+
+    def token_error(self):
+        token = self.curtoken
+        return ParserError(token.pos, token.type, token.lines)
+
+
+if __name__ == '__main__':
+    for lhs in sorted(TABLE):
+        print lhs
+        print '    FIRST  ', ' '.join(sorted(terminal_name(t) for t in FIRST[lhs]))
+        print '    FOLLOW ', ' '.join(sorted(terminal_name(t) for t in FOLLOW[lhs]))
+        for terminal, rhs in sorted(TABLE[lhs].items()):
+            print '    %-10s -> %s' % (terminal_name(terminal),
+                                       ' '.join(map(symbol_name, rhs[::-1])) or '<empty>')
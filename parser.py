@@ -2,23 +2,47 @@
 #
 # Scanner for a calculator interpreter
 
+import sys
+
 import scanner as mt_scanner
+import llparser
 import ast
 
+# ParserError is defined beside the LL(1) driver that raises it, so that
+# it is the same class however this module is loaded.
+from llparser import ParserError
+
+
+class Placeholder(object):
+    """ The one node every NullFactory constructor returns. It is shared,
+        so it has no instance attributes to write to.
+    """
+
+    __slots__ = ()
+
+    start = None
+    end = None
+
+PLACEHOLDER = Placeholder()
 
-class ParserError(Exception):
-    """ Parser error exception.
+def placeholder(*args):
+    return PLACEHOLDER
 
-        pos: position in the input token stream where the error occurred.
-        type: bad token type
+class NullFactory(object):
+    """ A node factory for recognizing only: every constructor returns
+        PLACEHOLDER, so parsing walks the grammar without building a tree.
     """
 
-    def __init__(self, pos, type):
-        self.pos = pos
-        self.type = type
+    # Tells llparser.LLParser to skip values, actions and spans.
+    recognize_only = True
 
-    def __str__(self):
-        return '(Found bad token %s at %d)' % (mt_scanner.TOKENS[self.type], self.pos)
+    Program = AssignCommand = CallCommand = BlockCommand = IfCommand = \
+        WhileCommand = LetCommand = IntegerExpression = VnameExpression = \
+        UnaryExpression = BinaryExpression = Vname = ConstDeclaration = \
+        VarDeclaration = DeclarationList = TypeDenoter = ErrorCommand = \
+        ErrorDeclaration = ErrorExpression = staticmethod(placeholder)
+
+NULL_FACTORY = NullFactory()
 
 
 class Parser(object):
@@ -32,7 +56,7 @@ class Parser(object):
         single-Command     ::=  V-name ':=' Expression
                             |   Identifier '(' Expression ')'
                             |   if Expression then single-Command
-                                   else single-Command
+                                   [';'] else single-Command
                             |   while Expression do single-Command
                             |   let Declaration in single-Command
                             |   begin Command end
@@ -62,234 +86,280 @@ class Parser(object):
         Integer-Literal    ::=  Digit | Integer-Literal Digit
 
         Comment            ::=  ! Graphic* <eol>
+
+        The grammar is implemented once, by the LL(1) table llparser.TABLE
+        generated from llparser.GRAMMAR, with operator precedence for
+        Expressions: every method runs llparser.LLParser on the token
+        stream.
     """
 
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.curindex = 0
-        self.curtoken = tokens[0]
-    
+    def __init__(self, tokens, factory=ast, recover=False):
+        # tokens may be a list or any iterator of Tokens ending in TK_EOT,
+        # such as a Scanner; only the current token is held.
+        self.tokens = iter(tokens)
+        self.curtoken = next(self.tokens)
+        # Nodes are built by calling the classes of factory by name.
+        self.factory = factory
+        # With recover set, syntax errors are collected in errors and
+        # replaced by Error nodes instead of being raised.
+        self.recovering = recover
+        self.errors = []
+
     def parse(self):
-        #self.parse_exprlines()
-        e1 = self.parse_program()
-        return e1
+        return self.parse_table('Program')
 
-    def parse_program(self):
-        """ Program  :== single-Command EOT """
+    def parse_table(self, start):
+        """Parse a start phrase of llparser.GRAMMAR from the current token
+        with the generated LL(1) table, and return its node.
+        """
 
-        e1 = self.parse_command()
-        self.token_accept(mt_scanner.TK_EOT)
-        return ast.Program(e1);
+        ll = llparser.LLParser(self.tokens, self.factory,
+                               curtoken=self.curtoken,
+                               recover=self.recovering)
+        try:
+            return ll.parse(start)
+        finally:
+            self.curtoken = ll.curtoken
+            self.errors.extend(ll.errors)
 
-    def parse_command(self):
-        """ Expression          ::=  primary-Expression
-                                |   Expression Operator primary-Expression
+    def validate(self):
+        """ Check the syntax of the token stream without building a tree.
+
+            Return None if it is a valid Program, otherwise the first
+            ParserError.
         """
 
-        token = self.token_current()
-
-        if(token.type == mt_scanner.TK_LET):
-            comm = self.parse_let()
-        elif(token.type == mt_scanner.TK_IDENTIFIER):
-            comm = self.parse_identifier()
-        elif(token.type == mt_scanner.TK_BEGIN):
-            comm = self.parse_begin()
-        elif(token.type == mt_scanner.TK_WHILE):
-            self.token_accept(mt_scanner.TK_WHILE)
-            exp = self.parse_expr()
-            self.token_accept(mt_scanner.TK_DO)
-            comm = self.parse_command()
-            comm = ast.WhileCommand(exp, comm)
-        elif(token.type == mt_scanner.TK_IF):
-            self.token_accept(mt_scanner.TK_IF)
-            exp = self.parse_expr()
-            self.token_accept_any()
-            comm1 = self.parse_command()
-            self.token_accept_any()
-            self.token_accept(mt_scanner.TK_ELSE)
-            comm2 = self.parse_command()
-            comm = ast.IfCommand(exp, comm1, comm2)
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
-
-
-        return comm
-
-    def parse_begin(self):
-        self.token_accept_any()
-        comm = self.parse_command()
-        token = self.token_current()
-        while token.type == mt_scanner.TK_SEMICOLON:
-            self.token_accept_any()
-            token = self.token_current()
-            if token.type == mt_scanner.TK_END:
-                break
-            comm2 = self.parse_command()
-            token = self.token_current()
-            comm = ast.SequentialCommand(comm, comm2)
-        self.token_accept(mt_scanner.TK_END)
-        return comm
-
-    def parse_identifier(self):
-        token = self.token_current()
-        vname = ast.Vname(token.val)
-        self.token_accept_any()
-        token = self.token_current()
-
-        if(token.type == mt_scanner.TK_BECOMES):
-            self.token_accept_any()
-            e2 = self.parse_expr()
-            e1 = ast.AssignCommand(vname, e2)
-        elif(token.type == mt_scanner.TK_LPAREN):
-            self.token_accept_any()
-            e2 = self.parse_expr()
-            self.token_accept(mt_scanner.TK_RPAREN)
-            e1 = ast.CallCommand(vname.identifier, e2)
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
-        return e1
-
-    def parse_expr(self):
-        e1 = self.parse_secexpr()
-        token = self.token_current()
-        while token.type == mt_scanner.TK_OPERATOR and token.val in ['>', '<', '=']:
-            oper = token.val
-            self.token_accept_any()
-            e2 = self.parse_secexpr()
-            token = self.token_current()
-            e1 = ast.BinaryExpression(e1, oper, e2)
-        return e1
-
-    def parse_secexpr(self):
-        """ SecExpr :== PriExpr (OPER_PRI PriExpr)*"""
-
-        e1 = self.parse_tertexpr()
-        token = self.token_current()
-        while token.type == mt_scanner.TK_OPERATOR and token.val in ['+', '-']:
-            oper = token.val
-            self.token_accept_any()
-            e2 = self.parse_tertexpr()
-            token = self.token_current()
-            e1 = ast.BinaryExpression(e1, oper, e2)
-        return e1
-
-    def parse_tertexpr(self):
-        """ TertExpr :== PriExpr (OPER_PRI PriExpr)*"""
-
-        e1 = self.parse_priexpr()
-        token = self.token_current()
-        while token.type == mt_scanner.TK_OPERATOR and token.val in ['*', '/', '\\']:
-            oper = token.val
-            self.token_accept_any()
-            e2 = self.parse_priexpr()
-            token = self.token_current()
-            e1 = ast.BinaryExpression(e1, oper, e2)
-        return e1
-
-    def parse_priexpr(self):
-        """ primary-Expression ::=  Integer-Literal
-                                |   V-name
-                                |   Operator primary-Expression
-                                |   '(' Expression ')' 
+        factory = self.factory
+        recovering = self.recovering
+        self.factory = NULL_FACTORY
+        self.recovering = False
+        try:
+            self.parse_table('Program')
+        except ParserError as e:
+            return e
+        finally:
+            self.factory = factory
+            self.recovering = recovering
+        return None
+
+    def parse_units(self):
+        """ Parse a Program, generating its top-level units one at a time.
+
+            The let and begin commands that make up the outside of the
+            Program are taken apart (see llparser.CONTAINERS), and each
+            single-Declaration and other single-Command in them is yielded
+            as soon as it has been parsed, so a consumer can lower and drop
+            every unit before the next one is read. A Program of any other
+            command is yielded as that one single-Command. Syntax errors
+            are raised.
         """
 
-        token = self.token_current()
-        if token.type == mt_scanner.TK_INTLITERAL:
-            e1 = ast.IntegerExpression(token.val)
-            self.token_accept_any()
-        elif token.type == mt_scanner.TK_LPAREN:
-            self.token_accept_any()
-            e1 = self.parse_expr()
-            self.token_accept(mt_scanner.TK_RPAREN)
-        elif token.type == mt_scanner.TK_IDENTIFIER:
-            vname = ast.Vname(token.val)
-            e1 = ast.VnameExpression(vname)
-            self.token_accept_any()
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
+        ll = llparser.LLParser(self.tokens, self.factory,
+                               curtoken=self.curtoken)
+        try:
+            for unit in ll.parse_units():
+                yield unit
+        finally:
+            self.curtoken = ll.curtoken
+
+    def parse_command(self):
+        """ single-Command ::=  V-name ':=' Expression
+                            |   Identifier '(' Expression ')'
+                            |   if Expression then single-Command
+                                   [';'] else single-Command
+                            |   while Expression do single-Command
+                            |   let Declaration in single-Command
+                            |   begin Command end
+        """
 
-        return e1
+        return self.parse_table('single-Command')
 
     def parse_declaration(self):
-        token = self.token_current()
-        if(token.type == mt_scanner.TK_VAR):
-            self.token_accept_any()
-            decl = self.parse_var()
-            self.token_accept_any()
-        elif(token.type == mt_scanner.TK_CONST):
-            self.token_accept_any()
-            decl = self.parse_const()
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
-        return decl
-
-
-
-    def parse_let(self):
-        self.token_accept_any()
-        decl = self.parse_declaration()
-        token = self.token_current()
-        while token.type == mt_scanner.TK_SEMICOLON:
-            self.token_accept_any()
-            token = self.token_current()
-            if token.type == mt_scanner.TK_IN:
-                break
-            decl2 = self.parse_declaration()
-            token = self.token_current()
-            decl = ast.SequentialDeclaration(decl, decl2)
-
-        self.token_accept(mt_scanner.TK_IN)
-        comm = self.parse_command()
-        e1 = ast.LetCommand(decl, comm)
-
-        return e1
-
-    def parse_const(self):
-        token = self.token_current()
-
-        if(token.type == mt_scanner.TK_IDENTIFIER):
-            vname = token.val
-            self.token_accept_any()
-            self.token_accept(mt_scanner.TK_IS)
-            token = self.token_current()
-            exp = self.parse_expr()
-            e1 = ast.ConstDeclaration(vname, exp)
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
+        """ single-Declaration ::=  const Identifier ~ Expression
+                                |   var Identifier : Type-denoter
+        """
 
-        return e1
+        return self.parse_table('single-Declaration')
 
-    def parse_var(self):
-        token = self.token_current()
 
-        if(token.type == mt_scanner.TK_IDENTIFIER):
-            vname = token.val
-            self.token_accept_any()
-            self.token_accept(mt_scanner.TK_COLON)
-            token = self.token_current()
-            var_type = ast.TypeDenoter(token.val)
-            e1 = ast.VarDeclaration(vname, var_type)
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
+# Reparsable children of each node type: attributes holding a single node,
+# and attributes holding a list of nodes.
 
-        return e1
+UNIT_FIELDS = {ast.Program:               ('command',),
+               ast.WhileCommand:          ('command',),
+               ast.IfCommand:             ('command1', 'command2'),
+               ast.LetCommand:            ('declaration', 'command'),
+               ast.SequentialCommand:     ('command1', 'command2'),
+               ast.SequentialDeclaration: ('decl1', 'decl2')}
 
-    def token_current(self):
-        return self.curtoken
-        
-    def token_accept_any(self):
-        # Do not increment curindex if curtoken is TK_EOT.
-        if self.curtoken.type != mt_scanner.TK_EOT:
-            self.curindex += 1
-            self.curtoken = self.tokens[self.curindex]
+UNIT_LISTS = {ast.BlockCommand:    'commands',
+              ast.DeclarationList: 'declarations'}
 
-    def token_accept(self, type):
-        if self.curtoken.type != type:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
-        self.token_accept_any()
+
+def unit_children(node):
+    """Generate (attribute, index, child) for the commands and declarations
+    directly below node; index is None unless the attribute is a list.
+    """
+
+    for attr in UNIT_FIELDS.get(type(node), ()):
+        yield attr, None, getattr(node, attr)
+    attr = UNIT_LISTS.get(type(node))
+    if attr is not None:
+        for index, child in enumerate(getattr(node, attr)):
+            yield attr, index, child
+
+
+def find_unit(node, offset, limit):
+    """Find the child of node whose span covers [offset, limit) with the
+    edit strictly after its first token. Nodes without a span (such as a
+    DeclarationList) are searched through. Return (parent, attribute,
+    index, child) or None.
+    """
+
+    attr = UNIT_LISTS.get(type(node))
+    if attr is not None:
+        # Children of a list are in source order: binary search for the
+        # last one that starts before offset.
+        children = getattr(node, attr)
+        lo, hi = 0, len(children)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = children[mid].start
+            if start is not None and start >= offset:
+                hi = mid
+            else:
+                lo = mid + 1
+        candidates = [(attr, lo - 1, children[lo - 1])] if lo else []
+    else:
+        candidates = unit_children(node)
+
+    for attr, index, child in candidates:
+        if child.start is None:
+            found = find_unit(child, offset, limit)
+            if found is not None:
+                return found
+        elif child.start < offset and limit <= child.end:
+            return node, attr, index, child
+    return None
+
+
+def shift_spans(node, offset, limit, delta, skip):
+    """Move the spans below node to match an edit that replaced the text
+    in [offset, limit) and changed its length by delta. The subtree skip
+    is already up to date.
+    """
+
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for attr, index, child in unit_children(node):
+            if child is skip:
+                continue
+            if child.start is not None:
+                if child.start >= limit:
+                    child.start += delta
+                    child.end += delta
+                elif child.end >= limit:
+                    child.end += delta
+                else:
+                    continue
+            stack.append(child)
+
+
+def reparse(tree, tokens, offset, removed, inserted):
+    """Bring tree up to date after a local edit to its source text.
+
+    tree:     the Program parsed from the text before the edit.
+    tokens:   the Token list of the text after the edit, for example from
+              scanner.rescan().
+    offset, removed, inserted: the edit, as for scanner.rescan().
+
+    Only the smallest command or declaration that encloses the edit is
+    parsed again; if the new parse does not end where the old one did, the
+    next enclosing one is tried, and the whole program as a last resort.
+    The new subtree is spliced into tree in place and every other subtree
+    is kept, with its span shifted past the edit. Return the updated
+    Program, which is tree unless the whole program was parsed again.
+    """
+
+    limit = offset + removed
+    delta = len(inserted) - removed
+
+    path = []
+    node = tree
+    while 1:
+        found = find_unit(node, offset, limit)
+        if found is None:
+            break
+        path.append(found)
+        node = found[3]
+
+    for depth in xrange(len(path) - 1, -1, -1):
+        parent, attr, index, child = path[depth]
+        # Find the child's first token; the text before offset has not
+        # changed, so it is still at child.start.
+        lo, hi = 0, len(tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tokens[mid].pos < child.start:
+                lo = mid + 1
+            else:
+                hi = mid
+        parser = Parser(tokens[i] for i in xrange(lo, len(tokens)))
+        try:
+            if isinstance(child, ast.Declaration):
+                new = parser.parse_declaration()
+            else:
+                new = parser.parse_command()
+        except ParserError:
+            continue
+        if parser.curtoken.pos != child.end + delta:
+            continue
+
+        if index is None:
+            setattr(parent, attr, new)
+        else:
+            getattr(parent, attr)[index] = new
+        # Every node above new has changed structure. These are the
+        # parents and children along the path, which also covers a
+        # DeclarationList between a LetCommand and its declarations.
+        for above in path[:depth + 1]:
+            ast.clear_hash(above[0])
+        for above in path[:depth]:
+            ast.clear_hash(above[3])
+        shift_spans(tree, offset, limit, delta, new)
+        return tree
+
+    return Parser(tokens).parse()
+
+
+def validate_files(paths):
+    """Check the syntax of many source files without building trees.
+
+    Generate (path, error) for each path, where error is None for a valid
+    program, or the first ScannerError or ParserError, or the
+    EnvironmentError if the file cannot be read.
+    """
+
+    for path in paths:
+        try:
+            scanner = mt_scanner.Scanner(mt_scanner.map_file(path))
+            error = Parser(scanner).validate()
+        except (mt_scanner.ScannerError, EnvironmentError) as e:
+            error = e
+        yield path, error
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # Validate the files named on the command line.
+        status = 0
+        for path, error in validate_files(sys.argv[1:]):
+            if error is not None:
+                print '%s: %s' % (path, error)
+                status = 1
+        sys.exit(status)
+
     exprs = ["""
     ! isprime
     let var x: Integer;
@@ -340,7 +410,8 @@ if __name__ == '__main__':
 
         try:
             tree = parser.parse()
-            print tree
+            ast.dump(tree, indent=2)
+            print
         except ParserError as e:
             print e
             print 'Not Parsed!'
@@ -2,8 +2,12 @@
 #
 # Scanner for Mini Triangle
 
-import cStringIO as StringIO
-import string
+import mmap
+import re
+from array import array
+from bisect import bisect_right
+
+from symtab import SymbolTable
 
 # Token Constants
 
@@ -53,18 +57,63 @@ TOKENS = {TK_IDENTIFIER: 'IDENTIFIER',
 
 OPER = ['+', '-', '*', '/', '<', '>', '=', "\\"]
 
+NEWLINE_RE = re.compile('\n')
+
+
+class LineIndex(object):
+    """ Maps positions in an input text to line and column numbers.
+
+        The line starts are found on the first lookup and kept, so each
+        later lookup is a binary search. Lines and columns count from 1.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = None
+
+    def line_col(self, pos):
+        """Return the (line, column) of position pos."""
+
+        starts = self.starts
+        if starts is None:
+            starts = self.starts = [0]
+            starts.extend(m.end() for m in NEWLINE_RE.finditer(self.text))
+        line = bisect_right(starts, pos)
+        return line, pos - starts[line - 1] + 1
+
+    def format(self, pos):
+        """Return pos as 'line:column'."""
+
+        return '%d:%d' % self.line_col(pos)
+
+
+def format_pos(pos, lines):
+    """Format pos as 'line:column' if a LineIndex is known."""
+
+    if lines is None:
+        return str(pos)
+    return lines.format(pos)
+
+
 class Token(object):
     """ A simple Token structure.
         
-        Contains the token type, value and position. 
+        Contains the token type, value and position, and optionally the
+        LineIndex of the text it was scanned from. Identifier tokens also
+        carry their symbol id in sym.
     """
-    def __init__(self, type, val, pos):
+    __slots__ = ('type', 'val', 'pos', 'lines', 'sym')
+
+    def __init__(self, type, val, pos, lines=None, sym=None):
         self.type = type
         self.val = val
         self.pos = pos
+        self.lines = lines
+        self.sym = sym
 
     def __str__(self):
-        return '(%s(%s) at %s)' % (TOKENS[self.type], self.val, self.pos)
+        return '(%s(%s) at %s)' % (TOKENS[self.type], self.val,
+                                   format_pos(self.pos, self.lines))
 
     def __repr__(self):
         return self.__str__()
@@ -74,32 +123,88 @@ class ScannerError(Exception):
     """ Scanner error exception.
 
         pos: position in the input text where the error occurred.
+        lines: LineIndex of the input text, if known.
     """
-    def __init__(self, pos, char):
+    def __init__(self, pos, char, lines=None):
         self.pos = pos
         self.char = char
+        self.lines = lines
 
     def __str__(self):
-        return 'ScannerError at pos = %d, char = %s' % (self.pos, self.char)
+        if self.lines is None:
+            return 'ScannerError at pos = %d, char = %s' % (self.pos, self.char)
+        return 'ScannerError at %s, char = %s' % (self.lines.format(self.pos),
+                                                  self.char)
+
+# Keyword spellings and single-character punctuation, looked up with a
+# single dict access once the master pattern has matched a token.
+
+KEYWORDS = {'begin': TK_BEGIN,
+            'const': TK_CONST,
+            'do':    TK_DO,
+            'else':  TK_ELSE,
+            'end':   TK_END,
+            'if':    TK_IF,
+            'in':    TK_IN,
+            'let':   TK_LET,
+            'then':  TK_THEN,
+            'var':   TK_VAR,
+            'while': TK_WHILE}
+
+PUNCT = {';':  TK_SEMICOLON,
+         ':':  TK_COLON,
+         ':=': TK_BECOMES,
+         '~':  TK_IS,
+         '(':  TK_LPAREN,
+         ')':  TK_RPAREN}
+
+# Master token pattern. Separators and comments are skipped by the leading
+# group; a comment runs up to (but not including) the end of the line, or
+# to the end of the text. The group that matched (m.lastindex) selects the
+# token class, and an empty match means end of text or a bad character.
+TOKEN_RE = re.compile(r'''
+    (?:[ \t\n\r\f\v]+|![^\n]*)*   # Separators and comments
+    (?:
+        ([0-9]+)                  # 1: Integer-Literal
+      | ([A-Za-z][A-Za-z0-9]*)    # 2: Identifier or keyword
+      | ([-+*/<>=\\])             # 3: Operator
+      | (:=|[;:~()])              # 4: Punctuation
+    )?
+''', re.VERBOSE)
+
+M_INT, M_CHARS, M_OPER, M_PUNCT = 1, 2, 3, 4
+
 
 class Scanner(object):
     """Implement a scanner for the following token grammar
     
-       Token     :== EOT | Int | '(' | ')' | Op
+       Token     :== EOT | Int | Identifier | Keyword | Op | Punct
        Int       :== Digit (Digit*)
-       Op        :== '+' | '-' | '*' | '/' 
+       Op        :== '+' | '-' | '*' | '/' | '<' | '>' | '=' | '\\'
+       Punct     :== ';' | ':' | ':=' | '~' | '(' | ')'
        Digit     :== [0..9]
 
-       Separator :== ' ' | '\t' | '\n'        
+       Separator :== ' ' | '\t' | '\n' | Comment
+       Comment   :== '!' Graphic* <eol>
     """
 
-    def __init__(self, input):
-        # Use StringIO to treat input string like a file.
-        self.inputstr = StringIO.StringIO(input)
-        self.eot = False   # Are we at the end of the input text?
-        self.pos = 0       # Position in the input text
-        self.char = ''     # The current character from the input text
-        self.char_take()   # Fill self.char with the first character
+    def __init__(self, input, pos=0, symbols=None):
+        # input may be a str, buffer, bytearray, memoryview or mmap. It is
+        # scanned in place; only the text of each token is copied out.
+        # Python 2's re module cannot read a memoryview, so that one case
+        # is copied once up front.
+        if isinstance(input, memoryview):
+            input = input.tobytes()
+        elif isinstance(input, bytearray):
+            input = buffer(input)
+        self.input = input
+        self.pos = pos     # Position in the input text
+        self.lines = LineIndex(input)
+        # Identifiers are interned here; pass a shared SymbolTable to keep
+        # symbol ids consistent across scans.
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
 
     def scan(self):
         """Main entry point to scanner object.
@@ -107,159 +212,239 @@ class Scanner(object):
         Return a list of Tokens.
         """
 
-        self.tokens = []
+        self.tokens = list(self)
+        return self.tokens
+
+    def __iter__(self):
+        """Generate Tokens on demand, ending with the TK_EOT token.
+
+        Nothing is scanned ahead of the consumer, so a parser can start
+        work before the rest of the input text has been tokenized.
+        """
+
+        scan_token = self.scan_token
         while 1:
-            token = self.scan_token()
-            self.tokens.append(token)
+            token = scan_token()
+            yield token
             if token.type == TK_EOT:
                 break
-        return self.tokens
     
-    def scan_token(self):
-        """Scan a single token from input text."""
+    def scan_token(self, make=Token):
+        """Scan a single token from input text.
 
-        c = self.char_current()
-        token = None
-        
-        while not self.char_eot():
-            if c.isspace():
-                self.char_take()
-                c = self.char_current() 
-                continue
-            if c.isdigit():
-                token = self.scan_int()
-                break
-            elif c.isalpha():
-                token = self.scan_chars()
-                break
-            elif c in OPER:
-                token = Token(TK_OPERATOR, c, self.char_pos())
-                self.char_take()
-                break
-            elif c == '!':
-                self.skip_comm()
-                c = self.char_current()
-                continue
-            elif c == ';':
-                token = Token(TK_SEMICOLON, 0, self.char_pos())
-                self.char_take()
-                break
-            elif c == ':':
-                token = Token(TK_COLON, 0, self.char_pos())
-                self.char_take()
-                c = self.char_current()
-                if c == '=':
-                    token = Token(TK_BECOMES, 0, self.char_pos()-1)
-                    self.char_take()
-                break
-            elif c == '~':
-                token = Token(TK_IS, 0, self.char_pos())
-                self.char_take()
-                break
-            elif c == '(':
-                token = Token(TK_LPAREN, 0, self.char_pos())
-                self.char_take()
-                break
-            elif c == ')':
-                token = Token(TK_RPAREN, 0, self.char_pos())
-                self.char_take()
-                break
-            else:
-                raise ScannerError(self.char_pos(), self.char_current())
-      
-        if token is not None:
-            return token
-           
-        if self.char_eot():
-            return(Token(TK_EOT, 0, self.char_pos()))
-
-
-    def skip_comm(self):
-        """Skips comments"""
-        while self.char_current() != '\n':
-            self.char_take()
-
-
-    def scan_int(self):
-        """Integer-Literal ::= Digit | Integer-Literal Digit"""
-      
-        pos = self.char_pos()
-        numlist = [self.char_take()]
-
-        while self.char_current().isdigit():
-            numlist.append(self.char_take())
-        
-        return Token(TK_INTLITERAL, int(string.join(numlist ,'')), pos)
-        
+        The token is built by calling make(type, val, pos, lines), which by
+        default creates a Token. Identifiers are interned in self.symbols
+        and built with make(type, val, pos, lines, sym).
+        """
 
-    def scan_chars(self):
-        """Identifier ::= Letter | Identifier Letter | Identifier Digit"""
-
-        pos = self.char_pos()
-        charList = [self.char_take()]
-
-        while self.char_current().isalnum():
-            charList.append(self.char_take())
-
-        token = string.join(charList, '')
-
-        if token == "begin":
-            return Token(TK_BEGIN, 0, pos)
-        elif token == "const":
-            return Token(TK_CONST, 0, pos)
-        elif token == "do":
-            return Token(TK_DO, 0, pos)
-        elif token == "else":
-            return Token(TK_ELSE, 0, pos)
-        elif token == "end":
-            return Token(TK_END, 0, pos)
-        elif token == "if":
-            return Token(TK_IF, 0, pos)
-        elif token == "in":
-            return Token(TK_IN, 0, pos)
-        elif token == "let":
-            return Token(TK_LET, 0, pos)
-        elif token == "then":
-            return Token(TK_THEN, 0, pos)
-        elif token == "var":
-            return Token(TK_VAR, 0, pos)
-        elif token == "while":
-            return Token(TK_WHILE, 0, pos) 
+        text = self.input
+        lines = self.lines
+        m = TOKEN_RE.match(text, self.pos)
+        kind = m.lastindex
+
+        if kind is None:
+            pos = m.end()
+            if pos < len(text):
+                raise ScannerError(pos, text[pos], lines)
+            self.pos = pos
+            return make(TK_EOT, 0, pos, lines)
+
+        pos = m.start(kind)
+        self.pos = m.end()
+
+        if kind == M_CHARS:
+            chars = m.group(M_CHARS)
+            type = KEYWORDS.get(chars)
+            if type is None:
+                symbols = self.symbols
+                sym = symbols.intern(chars)
+                return make(TK_IDENTIFIER, symbols.names[sym], pos, lines, sym)
+            return make(type, 0, pos, lines)
+        elif kind == M_INT:
+            return make(TK_INTLITERAL, int(m.group(M_INT)), pos, lines)
+        elif kind == M_OPER:
+            return make(TK_OPERATOR, m.group(M_OPER), pos, lines)
         else:
-            return Token(TK_IDENTIFIER, token, pos)
+            return make(PUNCT[m.group(M_PUNCT)], 0, pos, lines)
 
-    def char_current(self):
-        """Return in the current input character."""
+    def scan_buffer(self):
+        """Scan the whole input text into a TokenBuffer.
 
-        return self.char
+        No Token objects are created; use TokenBuffer.cursor() to feed the
+        result to a Parser.
+        """
 
-    def char_take(self):
-        """Consume the current character and read the next character 
-        from the input text.
+        buf = TokenBuffer(self.lines)
+        append = buf.append
+        types = buf.types
+        scan_token = self.scan_token
+        while 1:
+            scan_token(append)
+            if types[-1] == TK_EOT:
+                break
+        return buf
 
-        Update self.char, self.eot, and self.pos
-        """
 
-        char_prev = self.char
-        
-        self.char = self.inputstr.read(1)
-        if self.char == '':
-            self.eot = True
+def map_file(path):
+    """Map the source file at path read-only, for scanning in place.
 
-        self.pos += 1
-        
-        return char_prev
-        
-    def char_pos(self):
-        """Return the position of the *current* character in the input text."""
+    Return an mmap, or an empty string for an empty file (which cannot be
+    mapped).
+    """
 
-        return self.pos - 1
-        
-    def char_eot(self):
-        """Determine if we are at the end of the input text."""
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return ''
+
+
+def rescan(tokens, source, offset, removed, inserted, symbols):
+    """Retokenize source after a local edit, reusing the old tokens.
+
+    tokens:   the Tokens scanned from the text before the edit.
+    source:   the text after the edit.
+    offset:   where the edit starts.
+    removed:  how many characters were removed at offset.
+    inserted: the text inserted at offset.
+    symbols:  the SymbolTable the old tokens were scanned with; the new
+              tokens must be interned in it too, or their symbol ids
+              would clash with those of the reused tokens.
+
+    Scanning restarts at the last token that starts before the edit and
+    stops as soon as a new token lands on the start of an old token past
+    the edit; the rest of the text is unchanged, so the rest of the old
+    tokens are reused with their pos shifted in place. Return the new
+    token list.
+    """
+
+    delta = len(inserted) - removed
+
+    # Binary search for the first token at or after the edit.
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tokens[mid].pos < offset:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo > 0:
+        lo -= 1
+        start = tokens[lo].pos
+    else:
+        start = 0
+
+    result = tokens[:lo]
+    append = result.append
+    edit_end = offset + len(inserted)
+    old = lo
+    for token in Scanner(source, start, symbols):
+        if token.pos >= edit_end:
+            old_pos = token.pos - delta
+            while tokens[old].pos < old_pos:
+                old += 1
+            if tokens[old].pos == old_pos:
+                rest = tokens[old:]
+                lines = token.lines
+                for moved in rest:
+                    moved.pos += delta
+                    moved.lines = lines
+                result.extend(rest)
+                return result
+        append(token)
+    return result
+
+
+class TokenBuffer(object):
+    """ A compact, column-wise store of tokens.
+
+        types:     array of token types
+        positions: array of token positions
+        vals:      array of indexes into values
+        values:    table of distinct token values, each stored once
+        syms:      symbol id of each identifier in values, else None
+        lines:     LineIndex of the scanned text, if known
+    """
+
+    def __init__(self, lines=None):
+        self.lines = lines
+        self.types = array('i')
+        self.positions = array('i')
+        self.vals = array('i')
+        self.values = []
+        self.syms = []
+        self.value_index = {}
+
+    def append(self, type, val, pos, lines=None, sym=None):
+        index = self.value_index.get(val)
+        if index is None:
+            index = self.value_index[val] = len(self.values)
+            self.values.append(val)
+            self.syms.append(sym)
+        self.types.append(type)
+        self.positions.append(pos)
+        self.vals.append(index)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        """Build a standalone Token for the token at index."""
+
+        val = self.vals[index]
+        return Token(self.types[index], self.values[val],
+                     self.positions[index], self.lines, self.syms[val])
+
+    def __iter__(self):
+        for index in xrange(len(self.types)):
+            yield self[index]
+
+    def cursor(self):
+        """Return a TokenCursor positioned before the first token."""
+
+        return TokenCursor(self)
+
+
+class TokenCursor(object):
+    """ A movable view of one token in a TokenBuffer.
+
+        The cursor has the same attributes as a Token and
+        is its own iterator: next() moves it to the following token and
+        returns the cursor itself, so a Parser can read a buffer without a
+        Token being built per token. The attributes are only valid until
+        the next call to next().
+    """
+    __slots__ = ('type', 'val', 'pos', 'lines', 'sym', 'buf', 'index')
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.lines = buf.lines
+        self.index = -1
+        self.type = self.val = self.pos = self.sym = None
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        buf = self.buf
+        index = self.index + 1
+        if index >= len(buf.types):
+            raise StopIteration
+        self.index = index
+        self.type = buf.types[index]
+        val = buf.vals[index]
+        self.val = buf.values[val]
+        self.sym = buf.syms[val]
+        self.pos = buf.positions[index]
+        return self
+
+    def __str__(self):
+        return '(%s(%s) at %s)' % (TOKENS[self.type], self.val,
+                                   format_pos(self.pos, self.lines))
+
+    def __repr__(self):
+        return self.__str__()
 
-        return self.eot
-        
 
 if __name__ == '__main__':
     exprs = ["hi := :j",
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+#
+# server.py - Compile server for Mini Triangle
+#
+# Keeps the compiler loaded and answers compile requests from client.py
+# over a Unix socket; see client.py for the protocol.
+
+import errno
+import marshal
+import os
+import signal
+import socket
+import stat
+import sys
+import threading
+import SocketServer
+
+import scanner
+import parser
+import codegen
+import compiler
+import client
+
+
+class ServerError(Exception):
+    """ Compile server error exception.
+
+        Raised when the server cannot take its socket address.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return 'ServerError: %s' % (self.message)
+
+
+def remove_stale_socket(address):
+    """Remove the socket file at address if no server is listening on it.
+
+    Raise ServerError if address is something other than a socket, or if
+    a server still accepts connections on it.
+    """
+
+    try:
+        st = os.stat(address)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(st.st_mode):
+        raise ServerError('%s exists and is not a socket' % address)
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(address)
+    except socket.error as e:
+        if e.errno == errno.ECONNREFUSED:
+            # Left behind by a server that did not shut down cleanly.
+            os.remove(address)
+            return
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    finally:
+        probe.close()
+    raise ServerError('a server is already listening on %s' % address)
+
+
+class CompileHandler(SocketServer.BaseRequestHandler):
+    """ Answers the requests of one connection until the client closes it. """
+
+    def handle(self):
+        sock = self.request
+        while 1:
+            try:
+                frame = client.recv_frame(sock)
+            except EOFError:
+                return
+            if frame is None:
+                return
+            kind, payload = frame
+            status, payload = self.server.compile(kind, payload)
+            client.send_frame(sock, status, payload)
+
+
+class CompileServer(SocketServer.ThreadingMixIn,
+                    SocketServer.UnixStreamServer):
+    """ A compile server on the Unix socket at address.
+
+        Each connection is handled in its own thread. Compiled programs
+        are shared through one compiler.Compiler, so a program sent by
+        several clients is compiled once.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, compiler_obj=None):
+        remove_stale_socket(address)
+        SocketServer.UnixStreamServer.__init__(self, address, CompileHandler)
+        if compiler_obj is None:
+            compiler_obj = compiler.Compiler()
+        self.compiler = compiler_obj
+        self.lock = threading.Lock()
+
+    def compile(self, kind, payload):
+        """Answer a request as (status, payload).
+
+        Every failure is answered with a diagnostic, so one bad program
+        cannot take down its connection or the server.
+        """
+
+        try:
+            if kind == client.SOURCE:
+                source = payload
+            elif kind == client.PATH:
+                source = scanner.map_file(payload)
+            else:
+                return client.ERROR, 'bad request %r' % kind
+            with self.lock:
+                func = self.compiler.compile(source)
+            return client.CODE, marshal.dumps(func.func_code)
+        except (scanner.ScannerError, parser.ParserError,
+                codegen.CodeGenError, EnvironmentError) as e:
+            return client.ERROR, str(e)
+        except Exception as e:
+            # Anything else is a failure of the code generator or of
+            # byteplay, such as code it cannot assemble.
+            return client.ERROR, '%s: %s' % (type(e).__name__, e)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print 'usage: server.py SOCKET'
+        sys.exit(2)
+
+    try:
+        server = CompileServer(sys.argv[1])
+    except ServerError as e:
+        print e
+        sys.exit(1)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
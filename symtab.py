@@ -0,0 +1,42 @@
+# symtab.py - Symbol table for Mini Triangle identifiers
+
+
+class SymbolTable(object):
+    """ Interns identifiers and numbers them.
+
+        names: list of identifier strings, indexed by symbol id
+        ids:   dict mapping each identifier to its symbol id
+
+        Every occurrence of an identifier shares the one string object in
+        names, and ids are small integers counted from 0 in order of first
+        appearance.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        """Return the symbol id of name, adding it if it is new."""
+
+        sym = self.ids.get(name)
+        if sym is None:
+            name = intern(name)
+            sym = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return sym
+
+    def name(self, sym):
+        """Return the identifier with symbol id sym."""
+
+        return self.names[sym]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+#
+# watch.py - Rebuild Mini Triangle programs as their sources change
+
+import getopt
+import os
+import sys
+import time
+
+import scanner
+import parser
+import codegen
+from client import write_pyc
+from symtab import SymbolTable
+
+
+def find_edit(old, new):
+    """Return the edit that turns old into new as (offset, removed,
+    inserted), where the edit is the text between the longest common
+    prefix and the longest common suffix that do not overlap.
+    """
+
+    # Binary search on slice comparisons, so each step is one memcmp.
+    limit = min(len(old), len(new))
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[:mid] == new[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    offset = lo
+
+    limit -= offset
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[len(old) - mid:] == new[len(new) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    suffix = lo
+
+    removed = len(old) - offset - suffix
+    inserted = new[offset:len(new) - suffix]
+    return offset, removed, inserted
+
+
+class Program(object):
+    """ A watched source file, with what was built from it.
+
+        text, tokens, symbols and tree are those of the last version that
+        compiled, and are None if there is none; the next build of a file
+        with a tree only scans and parses the part that changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stamp = None   # (mtime, size) of the file when last built
+        self.text = None
+        self.tokens = None
+        self.symbols = None
+        self.tree = None
+
+    def changed(self):
+        """Return whether the file changed since it was last built."""
+
+        st = os.stat(self.path)
+        return (st.st_mtime, st.st_size) != self.stamp
+
+    def build(self):
+        """Bring the tree up to date with the file and return its code.
+
+        Raise scanner.ScannerError or parser.ParserError if the file does
+        not parse, and the next build starts from scratch; a
+        codegen.CodeGenError keeps the new tree.
+        """
+
+        st = os.stat(self.path)
+        self.stamp = (st.st_mtime, st.st_size)
+        with open(self.path, 'rb') as f:
+            text = f.read()
+
+        try:
+            if self.tree is None:
+                self.symbols = SymbolTable()
+                tokens = scanner.Scanner(text, symbols=self.symbols).scan()
+                tree = parser.Parser(tokens).parse()
+            else:
+                offset, removed, inserted = find_edit(self.text, text)
+                tokens = scanner.rescan(self.tokens, text, offset, removed,
+                                        inserted, self.symbols)
+                tree = parser.reparse(self.tree, tokens, offset, removed,
+                                      inserted)
+        except:
+            # rescan and reparse update the old tokens and tree in place,
+            # so they cannot be reused after a failure.
+            self.text = self.tokens = self.symbols = self.tree = None
+            raise
+        self.text = text
+        self.tokens = tokens
+        self.tree = tree
+        return codegen.CodeGen(tree, self.symbols).generate().func_code
+
+
+class Watcher(object):
+    """ Polls a set of files and directories for .mt files, rebuilding
+        the ones that change.
+
+        Mini Triangle programs do not import one another, so a changed file
+        only ever needs itself rebuilt. Each build writes the file's .pyc,
+        as codegen.py does, and is reported with the time it took.
+    """
+
+    def __init__(self, paths, interval=0.5, out=sys.stdout):
+        self.paths = paths
+        self.interval = interval
+        self.out = out
+        self.programs = {}
+
+    def sources(self):
+        """Return the .mt files under the watched paths."""
+
+        sources = []
+        for path in self.paths:
+            if not os.path.isdir(path):
+                sources.append(path)
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.endswith('.mt'):
+                        sources.append(os.path.join(dirpath, name))
+        return sources
+
+    def poll(self):
+        """Rebuild every source that changed since the last poll.
+
+        Return the number of sources rebuilt.
+        """
+
+        sources = self.sources()
+        seen = set(sources)
+        for path in self.programs.keys():
+            if path not in seen:
+                del self.programs[path]
+                self.out.write('%s: removed\n' % path)
+
+        rebuilt = 0
+        for path in sources:
+            program = self.programs.get(path)
+            if program is None:
+                program = self.programs[path] = Program(path)
+            try:
+                if not program.changed():
+                    continue
+            except OSError:
+                # Deleted since it was listed; the next poll drops it.
+                continue
+            self.build(program)
+            rebuilt += 1
+        return rebuilt
+
+    def build(self, program):
+        """Rebuild program, reporting the outcome. A failure is reported
+        and does not stop the watcher.
+        """
+
+        incremental = program.tree is not None
+        start = time.time()
+        try:
+            code = program.build()
+            pyc_file = os.path.splitext(program.path)[0] + '.pyc'
+            write_pyc(pyc_file, code, program.stamp[0])
+        except (scanner.ScannerError, parser.ParserError,
+                codegen.CodeGenError) as e:
+            self.out.write('%s: %s\n' % (program.path, e))
+            return
+        except EnvironmentError as e:
+            self.out.write('%s\n' % e)
+            return
+        except Exception as e:
+            # Code byteplay cannot assemble, for one.
+            self.out.write('%s: %s: %s\n' % (program.path,
+                                              type(e).__name__, e))
+            return
+        elapsed = (time.time() - start) * 1000
+        self.out.write('%s: %s in %.2fms\n' % (
+            program.path, 'updated' if incremental else 'built', elapsed))
+
+    def run(self):
+        """Poll until interrupted."""
+
+        while 1:
+            if self.poll():
+                self.out.flush()
+            time.sleep(self.interval)
+
+
+if __name__ == '__main__':
+    # watch.py [-i SECONDS] FILE_OR_DIR...
+    opts, args = getopt.getopt(sys.argv[1:], 'i:')
+    opts = dict(opts)
+    if not args:
+        print 'usage: watch.py [-i SECONDS] FILE_OR_DIR...'
+        sys.exit(2)
+
+    watcher = Watcher(args, float(opts.get('-i', 0.5)))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass